@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""A local SQLite archive of processed posts and what happened in them.
+
+Every post is stored with its plain text lines, along with its events:
+
+    votecount  the official vote count a game starts from
+    vote       a vote, with the player it was counted for (if it was)
+    unvote     an unvote
+    hammer     a vote that gave its target a majority
+    mod        a line addressed to the mod
+    vla        a V/LA notice
+    replace    a replacement announced by the mod
+
+Posts and events are indexed by thread, post number, author and event
+type, so questions like "every V/LA in this game" or "this player's votes"
+don't need the thread to be downloaded and parsed again.
+
+A thread is archived under its `t`/`f` query values when it is read from
+the forum, but under the file or directory name when it is replayed from
+saved pages, which carry no thread ID (see game_thread). The two are
+stored as different threads, even for the same game, so query with the
+same url or path the posts were archived with."""
+
+import argparse
+import json
+import os.path
+import sys
+from collections import namedtuple
+from urllib import parse as urlparse
+
+ArchivedPost = namedtuple('ArchivedPost', 'postnum author lines')
+Event = namedtuple('Event', 'postnum author type target line data')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS posts (
+    thread TEXT NOT NULL,
+    postnum INTEGER NOT NULL,
+    author TEXT NOT NULL,
+    lines TEXT NOT NULL,
+    PRIMARY KEY (thread, postnum)
+);
+CREATE INDEX IF NOT EXISTS posts_author ON posts (thread, author, postnum);
+
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    thread TEXT NOT NULL,
+    postnum INTEGER NOT NULL,
+    author TEXT NOT NULL,
+    type TEXT NOT NULL,
+    target TEXT,
+    line TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS events_post ON events (thread, postnum);
+CREATE INDEX IF NOT EXISTS events_type ON events (thread, type, postnum);
+CREATE INDEX IF NOT EXISTS events_author ON events (thread, author, postnum);
+'''
+
+def thread_key(query):
+    """The name a thread is archived under, from its `t`/`f` query values."""
+    return urlparse.urlencode(sorted(query.items()))
+
+def game_thread(game_url):
+    """The name a game is archived under, from its url or the path of its
+    saved pages."""
+    _, _, query = game_url.partition('?')
+    key = thread_key({k: v for k, v in urlparse.parse_qsl(query) if k in ['t', 'f']})
+    return key or os.path.basename(os.path.normpath(game_url))
+
+class Archive:
+    def __init__(self, path):
+        import sqlite3 # Only needed once there is an archive to open
+
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def add_post(self, thread, postnum, author, lines, events=()):
+        """Store a post and its events, replacing whatever was stored for
+        it before. `events` are `(type, target, line, data)` tuples.
+
+        Nothing is written until commit()."""
+        self.db.execute('DELETE FROM events WHERE thread = ? AND postnum = ?',
+                        (thread, postnum))
+        self.db.execute('INSERT OR REPLACE INTO posts VALUES (?, ?, ?, ?)',
+                        (thread, postnum, author, '\n'.join(lines)))
+        self.db.executemany(
+            'INSERT INTO events (thread, postnum, author, type, target, line, data) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(thread, postnum, author, type, target, line,
+              None if data is None else json.dumps(data))
+             for type, target, line, data in events])
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    @staticmethod
+    def _where(thread, author, start, end):
+        clauses = ['thread = ?']
+        params = [thread]
+        if author is not None:
+            clauses.append('author = ?')
+            params.append(author)
+        if start is not None:
+            clauses.append('postnum >= ?')
+            params.append(start)
+        if end is not None:
+            clauses.append('postnum <= ?')
+            params.append(end)
+        return clauses, params
+
+    def posts(self, thread, author=None, start=None, end=None):
+        """Archived posts in post order, optionally only one author's or
+        only those from `start` to `end` (inclusive)."""
+        clauses, params = self._where(thread, author, start, end)
+        rows = self.db.execute(
+            'SELECT postnum, author, lines FROM posts WHERE {} ORDER BY postnum'
+            .format(' AND '.join(clauses)), params)
+        for postnum, author, lines in rows:
+            yield ArchivedPost(postnum, author, lines.split('\n'))
+
+    def events(self, thread, types=None, author=None, start=None, end=None):
+        """Archived events in the order they happened, optionally only those
+        of some `types`, by one author, or from posts `start` to `end`."""
+        clauses, params = self._where(thread, author, start, end)
+        if types is not None:
+            clauses.append('type IN ({})'.format(', '.join('?' * len(types))))
+            params.extend(types)
+        rows = self.db.execute(
+            'SELECT postnum, author, type, target, line, data FROM events '
+            'WHERE {} ORDER BY postnum, id'.format(' AND '.join(clauses)), params)
+        for postnum, author, type, target, line, data in rows:
+            yield Event(postnum, author, type, target, line,
+                        None if data is None else json.loads(data))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Looks things up in a post archive written with modtool --archive")
+
+    parser.add_argument('archive',
+                        help="The archive database.")
+    parser.add_argument('game_url',
+                        help="The url of the game, or the path of the saved "
+                             "pages it was replayed from.")
+    commands = parser.add_subparsers(dest='command')
+    posts = commands.add_parser('posts', help="Print archived posts.")
+    posts.add_argument('-a', '--author', help="Only posts by this user.")
+    posts.add_argument('-s', '--start', type=int, help="The first post to print.")
+    posts.add_argument('-e', '--end', type=int, help="The last post to print.")
+    events = commands.add_parser('events', help="Print archived events.")
+    events.add_argument('-t', '--type', action='append', dest='types',
+                        help="Only events of this type (may be repeated).")
+    events.add_argument('-a', '--author', help="Only events from this user.")
+    events.add_argument('-s', '--start', type=int, help="The first post to include.")
+    events.add_argument('-e', '--end', type=int, help="The last post to include.")
+    votes = commands.add_parser('votes', help="Print a player's vote history.")
+    votes.add_argument('player')
+    count = commands.add_parser('count', help="Print the vote count as of a post.")
+    count.add_argument('post', type=int)
+    count.add_argument('-d', '--deadline',
+                       help="The deadline to display in the votecounter.")
+    count.add_argument('-b', '--backlink', action='store_true',
+                       help="Include link to previous vote count.")
+
+    args = parser.parse_args()
+    if args.command is None:
+        parser.error("a command is required")
+
+    thread = game_thread(args.game_url)
+    archive = Archive(args.archive)
+
+    if args.command == 'posts':
+        for post in archive.posts(thread, args.author, args.start, args.end):
+            print('{} - Post #{}:'.format(post.author, post.postnum))
+            for line in post.lines:
+                print('    ' + line)
+    elif args.command == 'events':
+        for event in archive.events(thread, args.types, args.author, args.start, args.end):
+            print('#{} {} [{}] {}'.format(event.postnum, event.author, event.type,
+                                          event.line or ''))
+    elif args.command == 'votes':
+        for event in archive.events(thread, ('vote', 'unvote'), args.player):
+            print('#{} {}'.format(event.postnum, event.target or event.line))
+    else:
+        from modtool import ModTool
+        mod_tool = ModTool(args.game_url, votecount=True, deadline=args.deadline,
+                           archive=archive)
+        mod_tool.rewind(args.post)
+        if not mod_tool.votes:
+            sys.exit("No vote count was archived before post {}".format(args.post))
+        mod_tool.print_vote_count(args.backlink)
@@ -0,0 +1,27 @@
+"""Writing files so that readers only ever see a complete one."""
+
+import contextlib
+import os
+import os.path
+import tempfile
+
+@contextlib.contextmanager
+def atomic_write(path, mode='w'):
+    """Open a file to write in place of `path`, which replaces it once the
+    block finishes without an error.
+
+    Every call writes to a temporary file of its own in the same
+    directory, so processes writing the same path at the same time (say
+    the daemon and a CLI run sharing a page cache) can't write into each
+    other's file, and nobody ever reads a half-written one."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                               prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode, encoding=None if 'b' in mode else 'utf-8') as f:
+            yield f
+        os.chmod(tmp, 0o644) # mkstemp makes it private
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        raise
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""Times each stage of turning thread pages into a vote count.
+
+By default the thread is generated with synth.py (see --help for the knobs);
+give a directory or archive of saved pages to time those instead, e.g. the
+fixtures next to this file:
+
+    python bench.py
+    python bench.py --posts 5000 --players 20 --abbrev abbrev
+    python bench.py fixtures --json before.json
+    python bench.py fixtures --compare before.json
+
+Stages, each the best of --repeat runs:
+
+    parse         lxml parsing of the page text
+    extract       quote removal and post/line extraction (posts.doc_records)
+    apply         vote state updates and reporting (ModTool.apply_records)
+    process_page  all of the above, end to end
+    fuzzy_vote    matching every vote on its own, with no caching
+    user_ratio    scoring every distinct vote against every player
+    vote_count    rendering the final vote count"""
+
+import argparse
+import io
+import json
+import os.path
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import lxml.html
+
+import synth
+from modtool import InvalidVoteError, ModTool, fuzzy_vote, line_vote
+from pagefiles import open_pages
+from posts import doc_records
+from usermatch import PlayerIndex, user_ratio
+
+GAME_URL = 'https://forum.mafiascum.net/viewtopic.php?f=53&t=1'
+
+def new_tool():
+    return ModTool(GAME_URL, votecount=True, deadline='whenever', out=io.StringIO())
+
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              universal_newlines=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def run(pages, repeat):
+    """Time every stage over `pages`, returning the results as a dict."""
+    docs = [lxml.html.fromstring(page) for page in pages]
+    records = [doc_records(doc)[1] for doc in docs]
+    posts = sum(len(r) for r in records)
+    votes = [vote for page in records for record in page for plain, raw_vote in record.lines
+             for vote in [line_vote(plain, raw_vote)] if vote is not None]
+
+    tool = new_tool()
+    for page in records:
+        tool.apply_records(page)
+    players = PlayerIndex(tool.valid_players)
+    distinct = sorted(set(votes))
+
+    def parse():
+        for page in pages:
+            lxml.html.fromstring(page)
+
+    def extract():
+        # Extraction drops quotes from the tree, so it needs fresh trees
+        for doc in [lxml.html.fromstring(page) for page in pages]:
+            doc_records(doc)
+
+    def apply():
+        tool = new_tool()
+        for page in records:
+            tool.apply_records(page)
+
+    def process_page():
+        tool = new_tool()
+        for page in pages:
+            tool.process_page(page)
+
+    def match():
+        for vote in votes:
+            try:
+                fuzzy_vote(vote, players)
+            except InvalidVoteError:
+                pass
+
+    def ratio():
+        for vote in distinct:
+            for player in players.players:
+                user_ratio(vote, player)
+
+    def vote_count():
+        tool.out = io.StringIO()
+        for _ in range(100):
+            tool.print_vote_count(True)
+
+    extract_time = best_time(extract, repeat) - best_time(parse, repeat)
+    stages = {
+        'parse': (best_time(parse, repeat), posts, 'posts'),
+        'extract': (max(extract_time, 0.0), posts, 'posts'),
+        'apply': (best_time(apply, repeat), posts, 'posts'),
+        'process_page': (best_time(process_page, repeat), posts, 'posts'),
+        'fuzzy_vote': (best_time(match, repeat), len(votes), 'votes'),
+        'user_ratio': (best_time(ratio, repeat), len(distinct) * len(players), 'pairs'),
+        'vote_count': (best_time(vote_count, repeat), 100, 'counts'),
+    }
+
+    tracemalloc.start()
+    process_page()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    end_to_end = stages['process_page'][0]
+    return {
+        'commit': commit(),
+        'python': platform.python_version(),
+        'pages': len(pages),
+        'posts': posts,
+        'votes': len(votes),
+        'distinct_votes': len(distinct),
+        'players': len(players),
+        'posts_per_sec': posts / end_to_end if end_to_end else None,
+        'votes_per_sec': len(votes) / end_to_end if end_to_end else None,
+        'peak_traced_bytes': peak,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'stages': {
+            name: {'seconds': seconds, 'items': items, 'unit': unit,
+                   'per_sec': items / seconds if seconds else None}
+            for name, (seconds, items, unit) in stages.items()
+        },
+    }
+
+def report(results, base=None):
+    print('{} pages, {} posts, {} votes ({} distinct), {} players'.format(
+        results['pages'], results['posts'], results['votes'],
+        results['distinct_votes'], results['players']))
+    print('{:>14} {:>10} {:>14}{}'.format('stage', 'ms', 'rate', '  vs base' if base else ''))
+    for name, stage in results['stages'].items():
+        line = '{:>14} {:>10.1f} {:>9.0f} {}/s'.format(
+            name, stage['seconds'] * 1000, stage['per_sec'] or 0, stage['unit'])
+        if base and name in base['stages'] and base['stages'][name]['seconds']:
+            line += '  {:+.1%}'.format(stage['seconds'] / base['stages'][name]['seconds'] - 1)
+        print(line)
+    print('{:.0f} posts/s, {:.0f} votes/s end to end'.format(
+        results['posts_per_sec'] or 0, results['votes_per_sec'] or 0))
+    print('peak traced memory {:.1f} MB, max RSS {:.1f} MB'.format(
+        results['peak_traced_bytes'] / 2**20, results['max_rss_kb'] / 2**10))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmarks page processing and vote matching")
+    parser.add_argument('pages', nargs='?',
+                        help="A directory or archive of saved pages to use "
+                             "instead of a synthetic thread.")
+    synth.add_arguments(parser)
+    parser.add_argument('-n', '--repeat', type=int, default=3,
+                        help="How many times to run each stage.")
+    parser.add_argument('--json', metavar='FILE',
+                        help="Also write the results as JSON to FILE ('-' for stdout).")
+    parser.add_argument('--compare', metavar='FILE',
+                        help="Show how each stage compares with the JSON results in FILE.")
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = [load() for load in open_pages(args.pages)]
+        options = {'pages': os.path.abspath(args.pages)}
+    else:
+        options = synth.thread_options(args)
+        pages = list(synth.thread_pages(**options))
+
+    results = run(pages, args.repeat)
+    results['options'] = options
+
+    base = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            base = json.load(f)
+    if args.json == '-':
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        report(results, base)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
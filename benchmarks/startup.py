@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Measures how long modtool takes to start.
+
+Two numbers are checked against a budget:
+
+    import  the cumulative `python -X importtime` of `import modtool`
+    cli     the wall clock of `modtool.py --help`, minus that of a bare
+            `python -c pass`, so interpreter startup isn't counted
+
+Both are the best of --repeat runs, with bytecode caching on (in a
+temporary directory, so nothing is written next to the sources) and one
+warm-up run first. The slowest imports are listed so a regression can be
+traced to the module that caused it:
+
+    python startup.py
+    python startup.py --repeat 10 --top 20
+    python startup.py --json -
+
+Exits with status 1 if either number is over budget."""
+
+import argparse
+import json
+import os
+import os.path
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+# Budgets in milliseconds. Importing requests, multiprocessing, sqlite3 or
+# the tar/zip modules up front blows through them; lxml and fuzzywuzzy are
+# needed by nearly every run and fit.
+BUDGET_MS = {'import': 80, 'cli': 150}
+
+_IMPORTTIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)')
+
+def environment(cache_dir):
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    env['PYTHONPYCACHEPREFIX'] = cache_dir
+    env['PYTHONWARNINGS'] = 'ignore'
+    return env
+
+def import_times(env):
+    """`(self_us, cumulative_us, depth, module)` for everything importing
+    modtool imports, in the order the imports finish."""
+    res = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import modtool'],
+                         cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = []
+    for line in res.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        if module == 'site' and not indent:
+            times = [] # Interpreter startup, not ours
+            continue
+        times.append((int(self_us), int(cumulative_us), len(indent) // 2, module))
+    return times
+
+def wall_time(args, env):
+    start = time.perf_counter()
+    subprocess.run(args, cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+def run(repeat):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = environment(cache_dir)
+        import_times(env) # Fill the bytecode cache
+        runs = [import_times(env) for _ in range(repeat)]
+        best = min(runs, key=lambda times: times[-1][1])
+        python = min(wall_time([sys.executable, '-c', 'pass'], env) for _ in range(repeat))
+        cli = min(wall_time([sys.executable, 'modtool.py', '--help'], env)
+                  for _ in range(repeat))
+    return {
+        'python': sys.version.split()[0],
+        'import_ms': best[-1][1] / 1000,
+        'cli_ms': max(cli - python, 0.0) * 1000,
+        'interpreter_ms': python * 1000,
+        'budget_ms': BUDGET_MS,
+        'modules': [{'module': module, 'self_ms': self_us / 1000,
+                     'cumulative_ms': cumulative_us / 1000, 'depth': depth}
+                    for self_us, cumulative_us, depth, module in best],
+    }
+
+def report(results, top):
+    print('import modtool  {:7.1f} ms  (budget {} ms)'.format(
+        results['import_ms'], results['budget_ms']['import']))
+    print('modtool --help  {:7.1f} ms  (budget {} ms, on top of {:.1f} ms for python itself)'.format(
+        results['cli_ms'], results['budget_ms']['cli'], results['interpreter_ms']))
+    print()
+    print('Slowest imports:')
+    print('    {:>9} {:>9}  module'.format('self ms', 'total ms'))
+    modules = sorted(results['modules'], key=lambda m: -m['self_ms'])[:top]
+    for m in modules:
+        print('    {:9.2f} {:9.2f}  {}{}'.format(
+            m['self_ms'], m['cumulative_ms'], '  ' * (m['depth'] - 1), m['module']))
+
+def over_budget(results):
+    return [name for name in ('import', 'cli')
+            if results[name + '_ms'] > results['budget_ms'][name]]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measures modtool's startup time")
+    parser.add_argument('-n', '--repeat', type=int, default=5,
+                        help="How many times to measure each number.")
+    parser.add_argument('--top', type=int, default=15,
+                        help="How many of the slowest imports to list.")
+    parser.add_argument('--json', metavar='FILE',
+                        help="Also write the results as JSON to FILE ('-' for stdout).")
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    if args.json == '-':
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        report(results, args.top)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+    over = over_budget(results)
+    if over:
+        print('Over budget: {}'.format(', '.join(over)), file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""Generates synthetic mafiascum thread pages for benchmarks.
+
+The pages use the same markup as the forum's phpBB theme (pagination,
+post/author/profile blocks, bbvote spans, blockquotes, the official vote
+count fieldset), so everything from parsing to vote counting is exercised.
+
+    python synth.py OUTDIR [--posts N] [--players N] [--votes P] ...
+
+Everything is seeded, so the same options always produce the same pages."""
+
+import argparse
+import os
+import os.path
+import random
+import re
+
+HEAD = ('<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" '
+        '"http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml" dir="ltr" lang="en-gb">'
+        '<head><title>Mini 1991</title></head><body>\n'
+        '<div class="pagination">{total} posts &bull; Page <strong>{page}</strong> '
+        'of <strong>{pages}</strong></div>\n')
+TAIL = '<div class="pagination">{total} posts</div></body></html>\n'
+
+NAMES = [
+    'northsidegal', 'Papa Zito', 'Almost50', 'Goron27', 'RadiantCowbells',
+    'havingfitz', 'Beefster', 'Not_Mafia', 'Cedrick', 'Jim Jam', 'Cool Guy',
+    'ElegantBanana', 'Scum Hunter', 'Town Crier', 'xXDarkLordXx', 'MrFrost',
+    'Lady Luck', 'the_silent_one', 'Quagmire42', 'BlueHat',
+]
+WORDS = ['red', 'moon', 'Iron', 'fox', 'Silver', 'owl', 'Night', 'storm', 'Lucky',
+         'tiger', 'Shadow', 'pine', 'Frost', 'bear', 'Golden', 'wolf']
+CHATTER = ['lorem', 'ipsum', 'scum', 'town', 'mod', 'vote:', 'a:b', 'I', 'think',
+           'is', 'suspicious', 'because', 'their', 'reads', 'are', 'bad', 'lol']
+ABBREV_STYLES = ('exact', 'lower', 'abbrev', 'typo', 'mixed')
+
+def player_names(count, rng):
+    """`count` distinct usernames: the built-in ones first, then made-up ones."""
+    names = NAMES[:count]
+    while len(names) < count:
+        name = rng.choice(WORDS) + rng.choice(['', '_', ' ']) + rng.choice(WORDS)
+        if rng.random() < 0.3:
+            name += str(rng.randint(1, 99))
+        if name not in names:
+            names.append(name)
+    return names
+
+def abbreviations(name):
+    """The ways players shorten a name: initials, first word, a prefix, and
+    initials with the trailing number (A50 for Almost50)."""
+    starts = [c for i, c in enumerate(name)
+              if c.isalnum() and (i == 0 or c.isupper() or not name[i-1].isalnum())]
+    forms = {name[:max(4, len(name) // 2)].lower()}
+    if len(starts) > 1:
+        forms.add(''.join(starts).lower())
+    first = re.split(r'[ _]', name)[0]
+    if first != name:
+        forms.add(first)
+    digits = re.search(r'\d+$', name)
+    if digits:
+        forms.add(name[0] + digits.group())
+    return sorted(forms)
+
+def typo(name, rng):
+    if len(name) < 4:
+        return name
+    i = rng.randrange(1, len(name) - 1)
+    if rng.random() < 0.5:
+        return name[:i] + name[i+1:]
+    return name[:i] + name[i+1] + name[i] + name[i+2:]
+
+def vote_text(name, style, rng):
+    """How a player writes a vote for `name` in the given abbreviation style."""
+    if style == 'mixed':
+        style = rng.choice(ABBREV_STYLES[:-1])
+    if style == 'lower':
+        return name.lower()
+    if style == 'abbrev':
+        return rng.choice(abbreviations(name))
+    if style == 'typo':
+        return typo(name, rng)
+    return name
+
+def quote(depth, rng, players):
+    """A blockquote nested `depth` deep, with votes and @mods inside that
+    must not be counted."""
+    inner = 'VOTE: {}<br />@mod inner'.format(rng.choice(players))
+    for _ in range(depth):
+        inner = ('<blockquote><div><cite>{} wrote:</cite>{}</div></blockquote>'
+                 .format(rng.choice(players), inner))
+    return inner + 'reply'
+
+def post_body(rng, players, votes, quotes, quote_depth, style):
+    lines = []
+    if rng.random() < votes:
+        target = vote_text(rng.choice(players), style, rng)
+        if rng.random() < 0.8:
+            lines.append('<span class="bbvote" title="This is an official vote.">'
+                         'VOTE: {}</span>'.format(target))
+        else:
+            lines.append('VOTE: {}'.format(target))
+    for _ in range(rng.randint(1, 5)):
+        k = rng.random()
+        if k < 0.05:
+            lines.append('<span class="bbvote" title="This is an official vote.">UNVOTE: </span>')
+        elif k < 0.08:
+            lines.append('@mod can I <b>claim</b> &amp; stuff?')
+        elif k < 0.1:
+            lines.append('I will be V/LA this weekend')
+        elif k < 0.1 + quotes:
+            lines.append(quote(rng.randint(1, quote_depth), rng, players))
+        elif k < 0.2 + quotes:
+            lines.append('<span style="font-weight: bold">bold <i>it<br />alic</i> text</span>')
+        else:
+            lines.append(' '.join(rng.choice(CHATTER) for _ in range(rng.randint(3, 20))))
+    rng.shuffle(lines)
+    return '<br />'.join(lines)
+
+def vote_count(players):
+    lines = ['<b>{}</b> (1): {}'.format(players[1], players[0]),
+             'Not Voting ({}): {}'.format(len(players) - 1, ', '.join(players[1:])),
+             '',
+             'With {} players alive, it takes {} to lynch.'.format(
+                 len(players), len(players) // 2 + 1),
+             'Deadline: whenever']
+    return ('Day 1 has begun.<fieldset><legend>Official Vote Count 1-0</legend>'
+            + '<br />'.join(lines) + '</fieldset>Good luck!')
+
+def post(postnum, user, body):
+    return ('<div id="p{n}" class="post bg{b}"><div class="inner"><div class="postbody">'
+            '<p class="author"><a href="./viewtopic.php?p={n}#p{n}"><strong>#{n}</strong></a>'
+            ' by <strong>{u}</strong></p><div class="content">{body}</div></div>'
+            '<dl class="postprofile" id="profile{n}"><dt><a href="./memberlist.php?u={n}">'
+            '{u}</a></dt><dd>Posts: 1234</dd></dl></div></div>\n'
+            ).format(n=postnum, u=user, body=body, b=postnum % 2 + 1)
+
+def thread_pages(posts=1000, players=12, page_size=200, votes=0.2, quotes=0.1,
+                 quote_depth=1, abbrev='mixed', replacements=1, mod='Mod', seed=0):
+    """Yield the text of every page of a synthetic game thread.
+
+    `votes` is the chance a post votes, `quotes` the chance a line quotes
+    someone (up to `quote_depth` deep), and `abbrev` how voters write names
+    (one of ABBREV_STYLES). The mod opens with an official vote count and
+    announces `replacements` replacements spread through the thread."""
+    rng = random.Random(seed)
+    roster = player_names(players, rng)
+    alive = list(roster)
+    replace_at = {posts * (i + 1) // (replacements + 1): i for i in range(replacements)}
+    pages = (posts + page_size - 1) // page_size
+    for page in range(pages):
+        out = [HEAD.format(total=posts, page=page + 1, pages=pages)]
+        for postnum in range(page * page_size, min(posts, (page + 1) * page_size)):
+            post_rng = random.Random(seed * 1000003 + postnum)
+            if postnum == 1:
+                out.append(post(postnum, mod, vote_count(roster)))
+            elif postnum in replace_at:
+                old = post_rng.choice(alive)
+                new = 'Replacement{}'.format(replace_at[postnum] + 1)
+                alive[alive.index(old)] = new
+                out.append(post(postnum, mod, '{} replaces {}'.format(new, old)))
+            else:
+                out.append(post(postnum, post_rng.choice(alive), post_body(
+                    post_rng, alive, votes, quotes, quote_depth, abbrev)))
+        out.append(TAIL.format(total=posts))
+        yield ''.join(out)
+
+def add_arguments(parser):
+    parser.add_argument('--posts', type=int, default=1000,
+                        help="How many posts the thread has.")
+    parser.add_argument('--players', type=int, default=12,
+                        help="How many players are in the game.")
+    parser.add_argument('--page-size', type=int, default=200,
+                        help="How many posts are on each page.")
+    parser.add_argument('--votes', type=float, default=0.2,
+                        help="The chance that a post contains a vote.")
+    parser.add_argument('--quotes', type=float, default=0.1,
+                        help="The chance that a line is a quote.")
+    parser.add_argument('--quote-depth', type=int, default=1,
+                        help="How deeply quotes can be nested.")
+    parser.add_argument('--abbrev', choices=ABBREV_STYLES, default='mixed',
+                        help="How voters write player names.")
+    parser.add_argument('--replacements', type=int, default=1,
+                        help="How many replacements the mod announces.")
+    parser.add_argument('--seed', type=int, default=0)
+
+def thread_options(args):
+    return dict(posts=args.posts, players=args.players, page_size=args.page_size,
+                votes=args.votes, quotes=args.quotes, quote_depth=args.quote_depth,
+                abbrev=args.abbrev, replacements=args.replacements, seed=args.seed)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Writes the pages of a synthetic game thread to a directory")
+    parser.add_argument('outdir')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    os.makedirs(args.outdir, exist_ok=True)
+    for i, page in enumerate(thread_pages(**thread_options(args))):
+        with open(os.path.join(args.outdir, 'page{:03d}.html'.format(i)), 'w',
+                  encoding='utf-8') as f:
+            f.write(page)
@@ -1,7 +1,6 @@
 import colorsys
 import sys
 import os
-import platform
 
 def clamp(x, lo, hi):
     if x < lo: return lo
@@ -104,7 +103,23 @@ def _rgb6_to_256color_index(r, g, b):
 
 Wr, Wg, Wb = 0.299, 0.587, 0.114
 #Wr, Wg, Wb = 1/3, 1/3, 1/3
+
+# (r, g, b, radix) -> 256-color index, filled in as colors are converted.
+# Emptied when it gets this big, so sweeping through millions of colors
+# can't use up memory.
+_INDEX_LUT = {}
+_INDEX_LUT_SIZE = 1 << 16
+
 def _rgb_to_256color_index(r, g, b, radix=255):
+    key = r, g, b, radix
+    index = _INDEX_LUT.get(key)
+    if index is None:
+        if len(_INDEX_LUT) >= _INDEX_LUT_SIZE:
+            _INDEX_LUT.clear()
+        index = _INDEX_LUT[key] = _nearest_256color_index(r, g, b, radix)
+    return index
+
+def _nearest_256color_index(r, g, b, radix):
     def close(x):
         if x >= 95:
             return round((x - 95) / 40) * 40 + 95
@@ -117,7 +132,6 @@ def _rgb_to_256color_index(r, g, b, radix=255):
     r = clamp(norm * r, 0, 255)
     g = clamp(norm * g, 0, 255)
     b = clamp(norm * b, 0, 255)
-
     nr = close(r)
     ng = close(g)
     nb = close(b)
@@ -132,6 +146,20 @@ def _rgb_to_256color_index(r, g, b, radix=255):
         return _rgb6_to_256color_index(
             (nr - 95) // 40 + 1, (ng - 95) // 40 + 1, (nb - 95) // 40 + 1)
 
+def rgb_to_256color_indices(colors, radix=255):
+    """The 256-color index of every `(r, g, b)` in `colors`, as bytes.
+
+    Each distinct color is only converted once, so long gradients and
+    palettes with repeats are cheap."""
+    seen = {}
+    indices = bytearray()
+    for color in colors:
+        index = seen.get(color)
+        if index is None:
+            index = seen[color] = _rgb_to_256color_index(*color, radix=radix)
+        indices.append(index)
+    return bytes(indices)
+
 def rgb_to_256color_fg(r, g, b, radix=256):
     return _fg256(_rgb_to_256color_index(r, g, b, radix))
 
@@ -156,6 +184,10 @@ def hsv_to_256color_fg(h, s, v):
 def hsv_to_256color_bg(h, s, v):
     return _bg256(_hsv_to_256color_index(h, s, v))
 
+def hsv_to_256color_indices(colors):
+    return rgb_to_256color_indices((colorsys.hsv_to_rgb(h, s, v) for h, s, v in colors),
+                                   radix=1)
+
 def _hsl_to_256color_index(h, s, l):
     return _rgb_to_256color_index(*colorsys.hls_to_rgb(h, l, s), radix=1)
 
@@ -165,6 +197,10 @@ def hsl_to_256color_fg(h, s, l):
 def hsl_to_256color_bg(h, s, l):
     return _bg256(_hsl_to_256color_index(h, s, l))
 
+def hsl_to_256color_indices(colors):
+    return rgb_to_256color_indices((colorsys.hls_to_rgb(h, l, s) for h, s, l in colors),
+                                   radix=1)
+
 # === 24-bit color conversions ===
 
 def hsv_to_truecolor_fg(h, s, v):
@@ -189,9 +225,11 @@ def hex_to_truecolor_bg(hexcolor):
 
 SUPPORTS_TRUECOLOR = os.environ.get('TRUECOLOR', '1') == '1'
 TERM = os.environ.get('TERM')
-SUPPORTS_ANSI = platform.system() != 'Windows'
+SUPPORTS_ANSI = sys.platform != 'win32'
 
 if sys.stdout.isatty(): # and SUPPORTS_ANSI:
+    fg256 = _fg256
+    bg256 = _bg256
     if SUPPORTS_TRUECOLOR:
         rgb_fg = _fg24bit
         rgb_bg = _bg24bit
@@ -216,25 +254,50 @@ else:
         BASIC_COLORS[key] = ''
     for key in STYLES:
         STYLES[key] = ''
-    rgb_fg = rgb_bg = hsv_fg = hsv_bg = hex_fg = hex_bg = hsl_fg = hsl_bg = (
+    rgb_fg = rgb_bg = hsv_fg = hsv_bg = hsl_fg = hsl_bg = (
         lambda x, y, z, radix=255: '')
+    hex_fg = hex_bg = fg256 = bg256 = lambda color: ''
 
 LAST = object()
 class Style:
-    __slots__ = '_style'
+    """An escape sequence prefix, applied by calling the style on a string.
+
+    Indexing or attribute access adds to the prefix. Every derived style is
+    remembered, so chains like fmt.bold['#8a6125'] only work out their
+    escape codes the first time."""
+    __slots__ = '_style', '_derived'
 
     STYLE_CONTEXT = [] # global stack for style context
+    _suffix = CLEAR # CLEAR followed by the escape codes of STYLE_CONTEXT
+
     def __init__(self, value=''):
         self._style = value
+        self._derived = {}
 
     def __call__(self, s, *args, **kwargs):
         if args or kwargs:
-            return ''.join([self._style, str(s).format(*args, **kwargs), CLEAR,
-                            *self.STYLE_CONTEXT])
-        else:
-            return ''.join([self._style, str(s), CLEAR, *self.STYLE_CONTEXT])
+            s = str(s).format(*args, **kwargs)
+        elif type(s) is not str:
+            s = str(s)
+        return self._style + s + Style._suffix
+
+    def _derive(self, key, make):
+        derived = self._derived.get(key)
+        if derived is None:
+            derived = self._derived[key] = make()
+        return derived
 
     def __getitem__(self, style):
+        # Keyed on the type as well, since fmt[1] and fmt[1.0] differ
+        try:
+            derived = self._derived.get((type(style), style))
+        except TypeError: # Unhashable, e.g. a list of RGB values
+            return self._resolve(style)
+        if derived is None:
+            derived = self._derived[type(style), style] = self._resolve(style)
+        return derived
+
+    def _resolve(self, style):
         if style in BASIC_COLORS:
             return Style(self._style + BASIC_COLORS[style])
         if style in STYLES:
@@ -269,31 +332,38 @@ class Style:
             raise AttributeError(attr)
 
     def hsv(self, h, s, v):
-        return Style(self._style + hsv_fg(h / 360, s, v))
+        return self._derive(('hsv', h, s, v),
+                            lambda: Style(self._style + hsv_fg(h / 360, s, v)))
 
     def hsl(self, h, s, l):
-        return Style(self._style + hsl_fg(h / 360, s, l))
+        return self._derive(('hsl', h, s, l),
+                            lambda: Style(self._style + hsl_fg(h / 360, s, l)))
 
     def hsv_bg(self, h, s, v):
-        return Style(self._style + hsv_bg(h / 360, s, v))
+        return self._derive(('hsv_bg', h, s, v),
+                            lambda: Style(self._style + hsv_bg(h / 360, s, v)))
 
     def hsl_bg(self, h, s, l):
-        return Style(self._style + hsl_bg(h / 360, s, l))
+        return self._derive(('hsl_bg', h, s, l),
+                            lambda: Style(self._style + hsl_bg(h / 360, s, l)))
 
     @property
     def clear(self):
-        return Style(CLEAR)
+        return _CLEAR_STYLE
 
     def __enter__(self):
         self.STYLE_CONTEXT.append(self._style)
+        Style._suffix = CLEAR + ''.join(self.STYLE_CONTEXT)
         print(self._style, end='')
 
     def __exit__(self, t, b, tb):
         self.STYLE_CONTEXT.pop()
-        print(CLEAR, *self.STYLE_CONTEXT, sep='', end='')
+        Style._suffix = CLEAR + ''.join(self.STYLE_CONTEXT)
+        print(Style._suffix, end='')
         return False
 
 fmt = format = Style()
+_CLEAR_STYLE = Style(CLEAR)
 
 if __name__ == '__main__':
     import sys
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Watches several games from one long-running process.
+
+Games are listed in an INI file, one section per game:
+
+    [DEFAULT]
+    interval = 30
+    cache = ~/.cache/modtool
+    archive = ~/.cache/modtool/posts.db
+
+    [Mini 1991]
+    url = https://forum.mafiascum.net/viewtopic.php?f=53&t=12345
+    modname = Beefster
+    deadline = 2017-06-01 12:00:00 EDT
+    votecount = yes
+    theme = Beef256
+    output = mini1991.log
+    checkpoint = mini1991.json
+
+With `json = yes`, a game's output is one JSON object per event instead
+of colored text (see modtool.py --json).
+
+Every game gets its own ModTool and output stream, but they all share one
+HTTP connection pool, and requests are spaced out so the forum sees a
+steady trickle instead of a burst."""
+
+import argparse
+import configparser
+import heapq
+import json
+import os
+import os.path
+import sys
+import time
+import traceback
+
+from archive import Archive
+from atomicfile import atomic_write
+from fetch import Fetcher, FetchError
+from modtool import ModTool
+from pagecache import PageCache
+from profiling import Profiler
+import themes
+
+class Game:
+    def __init__(self, name, tool, interval, max_interval):
+        self.name = name
+        self.tool = tool
+        self.interval = interval
+        self.max_interval = max_interval
+        self.delay = interval
+
+    def poll(self):
+        """Process any new posts and pick the delay until the next poll.
+
+        Errors only back this game off; the other games keep going."""
+        try:
+            active = self.tool.poll()
+        except FetchError as e:
+            self.tool.warning(e)
+            active = False
+        except Exception:
+            self.tool.error("Polling {} failed: {}", self.name, traceback.format_exc())
+            active = False
+        self.tool.out.flush()
+        if active:
+            self.delay = self.interval
+        else:
+            self.delay = min(self.delay * 2, self.max_interval)
+
+def load_games(config, fetcher, profile=False):
+    cache_dir = config.defaults().get('cache')
+    cache = PageCache(os.path.expanduser(cache_dir)) if cache_dir else None
+    archive_path = config.defaults().get('archive')
+    archive = Archive(os.path.expanduser(archive_path)) if archive_path else None
+    games = []
+    for name in config.sections():
+        section = config[name]
+        theme = section.get('theme')
+        output = section.get('output', '-')
+        checkpoint = section.get('checkpoint')
+        if checkpoint:
+            checkpoint = os.path.expanduser(checkpoint)
+        tool = ModTool(
+            section['url'],
+            votecount=section.getboolean('votecount', False),
+            modname=section.get('modname'),
+            deadline=section.get('deadline'),
+            theme=getattr(themes, theme) if theme else None,
+            fetcher=fetcher,
+            cache=cache,
+            checkpoint=checkpoint,
+            archive=archive,
+            profiler=Profiler() if profile else None,
+            events='json' if section.getboolean('json', False) else None,
+            out=sys.stdout if output == '-' else open(
+                os.path.expanduser(output), 'a', encoding='utf-8'),
+        )
+        if checkpoint and os.path.isfile(checkpoint):
+            try:
+                tool.load_checkpoint()
+            except (ValueError, KeyError) as e:
+                tool.error("Not watching {}: bad checkpoint {}: {}", name, checkpoint, e)
+                continue
+        games.append(Game(name, tool,
+                          section.getfloat('interval', 30),
+                          section.getfloat('max_interval', 600)))
+    return games
+
+def dump_profiles(games, path):
+    """Write every game's profile summary to `path` as JSON."""
+    summaries = {game.name: game.tool.update_profile().summary() for game in games}
+    with atomic_write(path) as f:
+        json.dump(summaries, f, indent=2)
+
+def run_games(games, profile=None):
+    """Poll every game forever, each on its own adaptive schedule.
+
+    With `profile`, the games' profiles are written to that file after
+    every poll."""
+    queue = [(0, i) for i in range(len(games))]
+    while queue:
+        when, i = heapq.heappop(queue)
+        wait = when - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        games[i].poll()
+        if profile:
+            dump_profiles(games, profile)
+        heapq.heappush(queue, (time.monotonic() + games[i].delay, i))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Watches many games at once for mod-relevant posts")
+
+    parser.add_argument('config',
+                        help="INI file with one section per game.")
+    parser.add_argument('-r', '--retries', type=int, default=3,
+                        help="How many times to retry a failed page request.")
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help="The minimum time between any two requests, in seconds.")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="Time every stage of every game and keep a JSON "
+                             "summary of it in FILE.")
+
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    if not config.read(args.config):
+        sys.exit("Could not read config file: {}".format(args.config))
+
+    fetcher = Fetcher(retries=args.retries, min_interval=args.rate)
+    try:
+        run_games(load_games(config, fetcher, args.profile is not None), args.profile)
+    except KeyboardInterrupt:
+        print()
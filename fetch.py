@@ -0,0 +1,140 @@
+import threading
+import time
+
+class FetchError(Exception):
+    """A request that failed with an error status (`status`), or without
+    one because of a network error (`reason`)."""
+    def __init__(self, url, status=None, reason=None):
+        super(FetchError, self).__init__(url, status, reason)
+        self.url = url
+        self.status = status
+        self.reason = reason
+
+    def __str__(self):
+        if self.status is None:
+            return "Request for {} failed: {}".format(self.url, self.reason)
+        return "Request for {} failed with status {}".format(self.url, self.status)
+
+class Fetcher:
+    """Downloads thread pages over one pooled, keep-alive HTTP session.
+
+    Responses are gzip-compressed when the forum supports it (requests asks
+    for it by default), and 429/5xx responses are retried with exponential
+    backoff before giving up with a FetchError, as are connection errors and
+    timeouts. With `min_interval`, requests from every thread sharing the
+    fetcher are spaced at least that many seconds apart.
+
+    The session (and requests itself) is only set up on the first request,
+    so runs that never go online don't pay for it."""
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, retries=3, backoff=0.5, pool_size=10, timeout=30,
+                 min_interval=0):
+        self._session = None
+        self._session_options = retries, backoff, pool_size
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self._next_slot = 0.0
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.bytes = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._new_session(*self._session_options)
+        return self._session
+
+    def _new_session(self, retries, backoff, pool_size):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(total=retries, backoff_factor=backoff,
+                      status_forcelist=self.RETRY_STATUSES,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                              max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _throttle(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def get(self, url, params=None, headers=None, stream=False):
+        """GET a URL, raising FetchError on a 4xx/5xx status or a network
+        error.
+
+        With `stream`, the body is left unread for the caller to iterate
+        over (see iter_text), and is not included in the byte counter."""
+        import requests
+
+        session = self.session
+        if self.min_interval:
+            self._throttle()
+        start = time.perf_counter()
+        try:
+            res = session.get(url, params=params, headers=headers,
+                              timeout=self.timeout, stream=stream)
+        except requests.RequestException as e:
+            with self._lock:
+                self.requests += 1
+                self.errors += 1
+            raise FetchError(url, reason=e) from e
+        elapsed = time.perf_counter() - start
+        retry_state = getattr(res.raw, 'retries', None)
+        with self._lock:
+            self.requests += 1
+            if retry_state is not None:
+                self.retries += len(retry_state.history)
+            if not stream:
+                self.bytes += len(res.content)
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+            if res.status_code >= 400:
+                self.errors += 1
+        if res.status_code >= 400:
+            res.close()
+            raise FetchError(res.url, res.status_code)
+        return res
+
+    def iter_text(self, res, chunk_size=16384):
+        """Iterate over the text of a `stream` response as it arrives,
+        raising FetchError if the connection fails partway."""
+        import requests
+
+        if res.encoding is None:
+            res.encoding = 'utf-8'
+        try:
+            yield from res.iter_content(chunk_size=chunk_size, decode_unicode=True)
+        except requests.RequestException as e:
+            raise FetchError(res.url, reason=e) from e
+        finally:
+            res.close()
+
+    def stats(self):
+        """Timing counters for every request made so far."""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'retries': self.retries,
+                'errors': self.errors,
+                'bytes': self.bytes,
+                'total_time': self.total_time,
+                'mean_time': self.total_time / self.requests if self.requests else 0.0,
+                'max_time': self.max_time,
+            }
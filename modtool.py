@@ -1,22 +1,31 @@
 #!/usr/bin/env python3
 
 import argparse
-import configparser
+import io
 import itertools
+import json
+import os
 import os.path
 import re
+import sys
+import time
 import traceback
 from collections import defaultdict
+from collections.abc import MutableMapping
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from urllib import parse as urlparse
 
-import requests
 import lxml.html
-from lxml import etree
-from fuzzywuzzy import process
 
+from archive import Archive, game_thread
+from atomicfile import atomic_write
 from colors import fmt
-from usermatch import user_ratio
-import themes
+from fetch import Fetcher, FetchError
+from pagecache import PageCache
+from posts import PostStream, doc_records, extract_records, post_record
+from profiling import NO_PROFILER, Profiler
+from usermatch import PlayerIndex
 
 class InvalidVoteError(Exception):
     def __str__(self):
@@ -41,29 +50,229 @@ def fuzzy_vote(vote, users, ambiguity_threshold=5):
         return vote
     if vote.lower() == 'no lynch':
         return 'No Lynch'
-    user_poss = list(users)
+    if not isinstance(users, PlayerIndex):
+        users = PlayerIndex(users)
     if len(vote) < 2:
         raise InvalidVoteError(vote)
-    options = process.extractBests(
-        vote, user_poss, processor=lambda x: x, scorer=user_ratio, score_cutoff=60)
+    return pick_vote(vote, users.extract(vote, score_cutoff=60), ambiguity_threshold)
+
+def pick_vote(vote, options, ambiguity_threshold=5):
+    """Choose the player a vote is for from its `(player, score)` options."""
     if options:
         match, score = options[0]
         if vote.lower() != match.lower():
             if len(options) >= 2 and abs(score - options[1][1]) < ambiguity_threshold:
-                print(options)
                 raise AmbiguityError(vote, match, options[1][0])
         return match
     else:
         raise NoMatchError(vote)
 
-def get_wagons(votes):
-    wagons = defaultdict(list)
-    for voter, (post, votee) in votes.items():
-        if votee is None:
-            wagons[None].append((post, voter))
-            continue
-        wagons[votee].append((post, voter))
-    return wagons
+class VoteResolver:
+    """Remembers how each vote string was matched against the current roster.
+
+    Votes are keyed on their exact text, since capitalization feeds into
+    abbreviation matching. Failed matches are remembered too and raise the
+    same error again. The cache is cleared whenever the roster changes."""
+
+    def __init__(self, players=(), profiler=NO_PROFILER):
+        self.hits = 0
+        self.misses = 0
+        self.profiler = profiler
+        self.set_players(players)
+
+    def set_players(self, players):
+        self.players = PlayerIndex(players)
+        self._cache = {}
+
+    def add_player(self, player):
+        """Add one player to the roster.
+
+        Only the cached votes the new player scores well enough against to
+        change are forgotten; the rest can't match any differently."""
+        self.players.add(player)
+        newcomer = PlayerIndex([player])
+        for vote in list(self._cache):
+            if (vote is not None and len(vote) >= 2 and vote.lower() != 'no lynch'
+                    and newcomer.extract(vote, score_cutoff=60)):
+                del self._cache[vote]
+
+    def resolve_many(self, votes):
+        """Match every vote in `votes` that isn't cached yet, in one batch.
+
+        Each distinct vote is scored once against the whole roster, however
+        many times it appears, so later calls to resolve() for them are
+        cache hits."""
+        rows = {}
+        for vote in dict.fromkeys(votes):
+            if vote not in self._cache:
+                self._match(vote, rows)
+
+    def _match(self, vote, rows=None):
+        self.misses += 1
+        start = time.perf_counter()
+        try:
+            if vote is not None and len(vote) >= 2 and vote.lower() != 'no lynch':
+                options = self.players.extract(vote, score_cutoff=60, rows=rows)
+                match, error = pick_vote(vote, options), None
+            else:
+                match, error = fuzzy_vote(vote, self.players), None
+        except InvalidVoteError as e:
+            match, error = None, e.with_traceback(None)
+        self._cache[vote] = match, error
+        self.profiler.vote(vote, time.perf_counter() - start)
+        return match, error
+
+    def resolve(self, vote):
+        try:
+            match, error = self._cache[vote]
+            self.hits += 1
+        except KeyError:
+            match, error = self._match(vote)
+        if error is not None:
+            # Drop the frames the last raise attached, or every repeat of
+            # the same bad vote would keep another set of them alive
+            raise error.with_traceback(None)
+        return match
+
+def wagon_order(wagon):
+    """Sort key for `(target, voters)` wagons: biggest first, then the one
+    that got its first vote earliest."""
+    _, voters = wagon
+    return -len(voters), voters[0][0] if voters else -999
+
+class VoteTable(MutableMapping):
+    """Every player's current vote, as `{voter: (post, votee)}`, with a live
+    tally of who is on each wagon.
+
+    Internally every name gets a slot ID the first time it is seen, and
+    votes are stored between slots, so rename() can hand a slot to a
+    replacement without touching the votes for it. Wagons are updated as
+    votes are set or players removed, so counting a wagon or finding its
+    voters never scans the whole table. Players stay in the order they were
+    added, like a dict, and `None` is the Not Voting wagon."""
+
+    def __init__(self, votes=()):
+        self._slots = {} # current name -> slot ID
+        self._names = [] # slot ID -> current name
+        self._votes = {} # voter slot -> (post, votee slot)
+        self._wagons = {} # votee slot -> {voter slot: post}
+        self._rank = {} # voter slot -> position in the table
+        self._ranks = itertools.count()
+        self.update(votes)
+
+    def _slot(self, name):
+        if name is None:
+            return None
+        try:
+            return self._slots[name]
+        except KeyError:
+            slot = self._slots[name] = len(self._names)
+            self._names.append(name)
+            return slot
+
+    def _name(self, slot):
+        return None if slot is None else self._names[slot]
+
+    def _voter_slot(self, voter):
+        slot = self._slots.get(voter)
+        if slot is None or slot not in self._votes:
+            raise KeyError(voter)
+        return slot
+
+    def _wagon(self, votee):
+        if votee is not None:
+            votee = self._slots.get(votee)
+            if votee is None:
+                return {}
+        return self._wagons.get(votee, {})
+
+    def __getitem__(self, voter):
+        post, votee = self._votes[self._voter_slot(voter)]
+        return post, self._name(votee)
+
+    def __setitem__(self, voter, vote):
+        post, votee = vote
+        voter, votee = self._slot(voter), self._slot(votee)
+        if voter in self._votes:
+            self._leave(voter)
+        else:
+            self._rank[voter] = next(self._ranks)
+        self._votes[voter] = post, votee
+        self._wagons.setdefault(votee, {})[voter] = post
+
+    def __delitem__(self, voter):
+        voter = self._voter_slot(voter)
+        self._leave(voter)
+        del self._votes[voter]
+        del self._rank[voter]
+
+    def _leave(self, voter):
+        _, votee = self._votes[voter]
+        wagon = self._wagons[votee]
+        del wagon[voter]
+        if not wagon:
+            del self._wagons[votee]
+
+    def __iter__(self):
+        return (self._names[voter] for voter in self._votes)
+
+    def __len__(self):
+        return len(self._votes)
+
+    @property
+    def majority(self):
+        """How many votes it takes to lynch."""
+        return len(self._votes) // 2 + 1
+
+    def count(self, votee):
+        """How many players are voting for `votee`."""
+        return len(self._wagon(votee))
+
+    def voters(self, votee):
+        """The players voting for `votee`, as `(post, voter)` pairs."""
+        return [(post, self._names[voter]) for voter, post in self._wagon(votee).items()]
+
+    def wagons(self):
+        """Every wagon, as `{votee: [(post, voter), ...]}`, read off the
+        tally. Wagons come in the order their first voter was added, and
+        voters in the order they were added."""
+        rank = self._rank.__getitem__
+        wagons = []
+        for votee, wagon in self._wagons.items():
+            voters = sorted(wagon.items(), key=lambda v: rank(v[0]))
+            wagons.append((rank(voters[0][0]), self._name(votee),
+                           [(post, self._names[voter]) for voter, post in voters]))
+        wagons.sort(key=lambda wagon: wagon[0])
+        return defaultdict(list, [(votee, voters) for _, votee, voters in wagons])
+
+    def rename(self, original, replacement):
+        """Give `original`'s vote, and every vote for them, to `replacement`,
+        who moves to the end of the table.
+
+        Raises KeyError if `original` isn't in the table."""
+        slot = self._voter_slot(original)
+        if replacement in self._slots: # Two slots to merge, do it by hand
+            self[replacement] = self[original]
+            del self[original]
+            for post, voter in self.voters(original):
+                self[voter] = post, replacement
+            return
+        del self._slots[original]
+        self._slots[replacement] = slot
+        self._names[slot] = replacement
+        self._votes[slot] = self._votes.pop(slot)
+        self._rank[slot] = next(self._ranks)
+
+def line_vote(plain, raw_vote):
+    """The vote string a line from iter_lines casts, as process_post would
+    pass it to count_vote, or None if it doesn't vote for anyone."""
+    if raw_vote is not None:
+        vtype, _, vote = raw_vote.partition(':')
+        if vtype == 'VOTE' and vote.strip().lower() != 'unvote':
+            return vote.strip()
+    elif plain.upper().startswith('VOTE:'):
+        return plain.split(':')[1].strip()
+    return None
 
 class ModTool:
     DEFAULT_STYLE = {
@@ -83,12 +292,14 @@ class ModTool:
     }
 
     def __init__(self, game_url, votecount=False, modname=None, deadline=None,
-                 theme=None, **kwargs):
-        self.base_url, query = game_url.split('?')
+                 theme=None, fetcher=None, cache=None, checkpoint=None, out=None,
+                 archive=None, profiler=None, events=None, **kwargs):
+        self.base_url, _, query = game_url.partition('?')
         self.query = {
             k: v for k, v in urlparse.parse_qsl(query)
             if k in ['t', 'f']
         }
+        self.thread = game_thread(game_url)
 
         self.votecount_enabled = votecount
         self.last_votecount_post = None
@@ -99,16 +310,55 @@ class ModTool:
         self.modname = modname
         self.valid_players = []
         self.replacements = {}
+        self.profiler = profiler or NO_PROFILER
+        self.resolver = VoteResolver(profiler=self.profiler)
+        self.last_post = None
+        self.checkpoint = checkpoint
+        self.out = out or sys.stdout
+
+        self.fetcher = fetcher or Fetcher()
+        self.cache = cache
+        self.archive = archive
+
+        # A function to pass every event to instead of printing anything
+        self.events = self.write_event if events == 'json' else events
 
         self.styles = dict(self.DEFAULT_STYLE)
         if theme:
             self.styles.update(theme)
 
     def warning(self, fmt, *args, **kwargs):
-        print(self.styles['warning']('WARNING: ' + str(fmt).format(*args, **kwargs)))
+        if self.events is not None:
+            self.emit('warning', message=str(fmt).format(*args, **kwargs))
+            return
+        print(self.styles['warning']('WARNING: ' + str(fmt).format(*args, **kwargs)),
+              file=self.out)
 
     def error(self, fmt, *args, **kwargs):
-        print(self.styles['error']('ERROR: ' + str(fmt).format(*args, **kwargs)))
+        if self.events is not None:
+            self.emit('error', message=str(fmt).format(*args, **kwargs))
+            return
+        print(self.styles['error']('ERROR: ' + str(fmt).format(*args, **kwargs)),
+              file=self.out)
+
+    def vote_count_state(self):
+        """The current vote count as plain data, in the order
+        print_vote_count lists it."""
+        def votes(voters):
+            return [{'post': p if p > 0 else None, 'player': voter}
+                    for p, voter in sorted(voters)]
+
+        wagons = self.votes.wagons()
+        return {
+            'day': self.day,
+            'count_no': self.count_no,
+            'players': len(self.votes),
+            'majority': self.votes.majority,
+            'wagons': [{'target': wagon, 'votes': votes(voters)}
+                       for wagon, voters in sorted(wagons.items(), key=wagon_order)
+                       if wagon is not None],
+            'not_voting': votes(wagons[None]),
+        }
 
     def print_vote_count(self, backlink=False):
         """Print a BBCode-formatted vote count."""
@@ -129,32 +379,31 @@ class ModTool:
             else:
                 return voter
 
-        with self.styles['votecount']:
-            wagons = get_wagons(self.votes)
-            playercount = len(self.votes)
-            majority = len(self.votes) // 2 + 1
-            print('[area=Official Vote Count {}-{}]'.format(self.day, self.count_no))
-            for wagon, voters in sorted(wagons.items(),
-                                        key=lambda x: (-len(x[1]), x[1][0][0]
-                                                       if x[1] else -999)):
-                if wagon is not None:
-                    print('[b]{wagon}[/b] ({count}): {voters} {lminus}'.format(
-                        wagon=wagon, count=len(voters), voters=', '.join(
-                            [vote_ref(*v) for v in sorted(voters)]),
-                        lminus=lminus(len(voters), majority)
-                    ))
-            print()
-            not_voting = wagons[None]
-            print('[i]Not Voting[/i] ({}): {}'.format(
-                len(not_voting), ', '.join([vote_ref(*v) for v in sorted(not_voting)])
-            ))
-            print()
-            print('With {} players alive, it takes {} to lynch.'.format(playercount, majority))
-            print()
-            print('[b]Deadline[/b]: [countdown]{}[/countdown]'.format(self.deadline))
-            if backlink and self.last_votecount_post is not None:
-                print('[size=75][post={}]Previous Vote Count[/post][/size]'.format(self.last_votecount_post))
-            print('[/area]')
+        wagons = self.votes.wagons()
+        playercount = len(self.votes)
+        majority = self.votes.majority
+        lines = ['[area=Official Vote Count {}-{}]'.format(self.day, self.count_no)]
+        for wagon, voters in sorted(wagons.items(), key=wagon_order):
+            if wagon is not None:
+                lines.append('[b]{wagon}[/b] ({count}): {voters} {lminus}'.format(
+                    wagon=wagon, count=len(voters), voters=', '.join(
+                        [vote_ref(*v) for v in sorted(voters)]),
+                    lminus=lminus(len(voters), majority)
+                ))
+        lines.append('')
+        not_voting = wagons[None]
+        lines.append('[i]Not Voting[/i] ({}): {}'.format(
+            len(not_voting), ', '.join([vote_ref(*v) for v in sorted(not_voting)])
+        ))
+        lines.append('')
+        lines.append('With {} players alive, it takes {} to lynch.'.format(playercount, majority))
+        lines.append('')
+        lines.append('[b]Deadline[/b]: [countdown]{}[/countdown]'.format(self.deadline))
+        if backlink and self.last_votecount_post is not None:
+            lines.append('[size=75][post={}]Previous Vote Count[/post][/size]'.format(self.last_votecount_post))
+        lines.append('[/area]')
+        print(self.styles['votecount'](''.join(line + '\n' for line in lines)),
+              end='', file=self.out)
 
     def count_vote(self, user, raw_vote, postnum):
         """Count a player's vote, trying to match the vote to a player.
@@ -170,44 +419,51 @@ class ModTool:
             self.votes[user] = postnum, None
             return False
         try:
-            vote = fuzzy_vote(raw_vote, self.valid_players)
-            while vote in self.replacements:
-                vote = self.replacements[vote]
+            vote = self.current_player(self.resolver.resolve(raw_vote))
             if vote:
                 self.votes[user] = postnum, vote
                 if raw_vote.lower() != vote.lower():
                     self.warning("'{}' ==> '{}'", raw_vote, vote)
-                return sum(v == vote for p, v in self.votes.values()) > len(self.votes) / 2
+                return self.votes.count(vote) >= self.votes.majority
             else:
                 self.error("'{}' could not be matched to any player!", raw_vote)
         except InvalidVoteError as e:
             self.error(str(e))
 
+    def current_player(self, player):
+        """Whoever holds `player`'s slot now, following replacements.
+
+        Every name looked up on the way is pointed straight at the current
+        player, so long chains of replacements are only walked once."""
+        current = player
+        while current in self.replacements:
+            current = self.replacements[current]
+        while player != current:
+            self.replacements[player], player = current, self.replacements[player]
+        return current
+
     def replace_player(self, original, replacement):
         self.valid_players.append(replacement)
+        self.resolver.add_player(replacement)
         self.replacements[original] = replacement
-        self.votes[replacement] = self.votes[original]
-        del self.votes[original]
-        for voter in self.votes:
-            p, v = self.votes[voter]
-            if v == original:
-                self.votes[voter] = p, replacement
-
-    def init_votes(self, vote_counter):
+        self.votes.rename(original, replacement)
+
+    def init_votes(self, vote_count):
+        """Start counting from an official vote count, as read_vote_count
+        returns it."""
         if not self.votecount_enabled:
             return
-        header = vote_counter.xpath('legend')[0]
-        _, dc = header.text_content().rsplit(None, 1)
+        with self.profiler.time('init_votes'):
+            self._init_votes(vote_count)
+
+    def _init_votes(self, vote_count):
+        legend, lines = vote_count
+        _, dc = legend.rsplit(None, 1)
         day, count_no = dc.split('-')
         self.day = int(day)
         self.count_no = int(count_no) + 1
-        header.drop_tree()
         fake_post_nums = itertools.count(-99)
-        for rawline in etree.tostring(vote_counter, encoding='unicode').split('<br />'):
-            try:
-                line = lxml.html.fromstring(rawline).text_content().strip()
-            except etree.ParserError:
-                continue
+        for line, _ in lines:
             if not line or line.startswith('Deadline') or ':' not in line:
                 continue
             wagon, voters = line.split(':', 1)
@@ -220,107 +476,487 @@ class ModTool:
             for voter in voters:
                 self.votes[voter] = next(fake_post_nums), wagon
         self.valid_players = list(self.votes)
+        self.resolver.set_players(self.valid_players)
 
-    def process_page(self, page, end_post=None):
-        doc = lxml.html.fromstring(page)
-        if end_post is None:
-            end_post = int(doc.find_class('pagination')[0].text_content().lstrip('"').split()[0])
-        for quote in doc.xpath('//blockquote'):
-            quote.drop_tree()
-        for post in doc.find_class('post'):
-            postnum = int(post.xpath('.//p[@class="author"]/a/strong')[0].text_content().strip().lstrip('#'))
-            user = post.xpath('.//dl[@class="postprofile"]/dt/a')[0].text_content().strip()
-            if postnum > end_post:
-                return end_post
-
-            if self.votes is None:
-                vote_counter = post.xpath('.//fieldset[legend[starts-with(text(),"Official Vote Count")]]')
-                if vote_counter:
-                    self.votes = {}
-                    if self.modname is None:
-                        self.modname = user
-                    self.last_votecount_post = postnum
-                    self.init_votes(vote_counter[0])
-                    continue
+    def process_post(self, post):
+        """Report and count everything mod-relevant in one Post."""
+        if self.last_post is not None and post.postnum <= self.last_post:
+            return
+        self.apply_post(post_record(post))
+
+    def apply_post(self, record):
+        """Report and count everything mod-relevant in one PostRecord.
+
+        Posts have to be applied in order, since every one can change the
+        vote state."""
+        postnum, user, lines, vote_count = record
+        if self.last_post is not None and postnum <= self.last_post:
+            return
+        self.last_post = postnum
+        events = [] # (type, target, line, data) for the archive
+
+        if self.votes is None and vote_count is not None:
+            self.votes = VoteTable()
+            if self.modname is None:
+                self.modname = user
+            self.last_votecount_post = postnum
+            self.init_votes(vote_count)
+            events.append(('votecount', None, None, {
+                'day': self.day,
+                'count_no': self.count_no,
+                'votes': [[voter, p, votee] for voter, (p, votee) in self.votes.items()],
+            }))
+            if self.events is not None and self.votecount_enabled:
+                self.emit('votecount', user, **self.vote_count_state())
+            self.archive_post(record, events)
+            return
+
+        important = [] # (style, line) pairs to print
+        deferred = []
+        for plain, raw_vote in lines:
+            plainlower = plain.lower()
+            if plainlower.startswith('mod') or '@mod' in plainlower:
+                important.append(('@mod', plain))
+                events.append(('mod', None, plain, None))
+
+            if 'V/LA' in plain.upper():
+                important.append(('v/la', plain))
+                events.append(('vla', None, plain, None))
 
-            post_text = etree.tostring(post.find_class('content')[0], encoding='unicode').strip()
-            important = []
-            deferred = []
-            for rawline in post_text.split('<br />'):
+            if 'replaces' in plain and user == self.modname:
+                important.append(('replace', plain))
                 try:
-                    line = lxml.html.fromstring(rawline)
-                except etree.ParserError:
-                    continue
-                plain = line.text_content().strip()
-                plainlower = plain.lower()
-                if plainlower.startswith('mod') or '@mod' in plainlower:
-                    important.append(self.styles['@mod'](plain))
-
-                if 'V/LA' in plain.upper():
-                    important.append(self.styles['v/la'](plain))
-
-                if 'replaces' in plain and user == self.modname:
-                    important.append(self.styles['replace'](plain))
-                    try:
-                        new, old = plain.split('replaces')
-                        self.replace_player(old.strip(), new.strip())
-                    except Exception:
-                        self.error("Unable to do replacement: {}", traceback.format_exc())
-
-                linevote = line.find_class('bbvote')
-                hammered = None
-                if linevote:
-                    raw_vote = linevote[0].text_content()
-                    vtype, vote = raw_vote.split(':')
-                    if vtype == 'VOTE' and vote.strip().lower() != 'unvote':
-                        important.append(self.styles['vote'](plain))
-                        hammered = self.count_vote(user, vote.strip(), postnum)
-                    else:
-                        important.append(self.styles['unvote'](plain))
-                        hammered = self.count_vote(user, None, postnum)
-                elif plain.upper().startswith('VOTE:'): #TODO: have user confirm if vote is intended
-                    important.append(self.styles['vote'](plain))
-                    hammered = self.count_vote(user, plain.split(':')[1].strip(), postnum)
-                elif plain.upper().startswith('UNVOTE'):
-                    important.append(self.styles['unvote'](plain))
+                    new, old = plain.split('replaces')
+                    self.replace_player(old.strip(), new.strip())
+                    events.append(('replace', new.strip(), plain, {'original': old.strip()}))
+                except Exception:
+                    self.error("Unable to do replacement: {}", traceback.format_exc())
+
+            hammered = None
+            counted = None # The vote target, if count_vote counted a vote
+            if raw_vote is not None:
+                vtype, vote = raw_vote.split(':')
+                if vtype == 'VOTE' and vote.strip().lower() != 'unvote':
+                    important.append(('vote', plain))
+                    hammered = self.count_vote(user, vote.strip(), postnum)
+                    counted = 'vote'
+                else:
+                    important.append(('unvote', plain))
                     hammered = self.count_vote(user, None, postnum)
+                    counted = 'unvote'
+            elif plain.upper().startswith('VOTE:'): #TODO: have user confirm if vote is intended
+                important.append(('vote', plain))
+                vote = plain.split(':')[1]
+                hammered = self.count_vote(user, vote.strip(), postnum)
+                counted = 'vote'
+            elif plain.upper().startswith('UNVOTE'):
+                important.append(('unvote', plain))
+                hammered = self.count_vote(user, None, postnum)
+                counted = 'unvote'
+            if counted is not None:
+                # count_vote returns None when it didn't count anything
+                target = self.votes[user][1] if counted == 'vote' and hammered is not None else None
+                events.append((counted, target, plain, None))
 
-                if hammered:
-                    important.append(self.styles['hammer']("{} has been HAMMERED!", vote))
-                    deferred.append(lambda: self.print_vote_count())
+            if hammered:
+                important.append(('hammer', "{} has been HAMMERED!".format(vote)))
+                events.append(('hammer', target, plain, None))
+                deferred.append(self._report_vote_count)
 
+        if self.events is not None:
+            for type, target, line, data in events:
+                self.emit(type, user, target, line, **(data or {}))
+            for thunk in deferred:
+                thunk()
+        else:
             if important:
-                print("{} - {}:".format(self.styles['user'](user),
-                                        self.styles['postnum']('Post #' + str(postnum))))
-                for line in important:
-                    print('    ' + line)
+                self.out.write("{} - {}:\n    {}\n".format(
+                    self.styles['user'](user), self.styles['postnum']('Post #' + str(postnum)),
+                    '\n    '.join(self.styles[style](line) for style, line in important)))
 
             for thunk in deferred:
                 thunk()
 
             if important or deferred:
-                print()
+                self.out.write('\n')
+
+        self.archive_post(record, events)
+
+    def _report_vote_count(self):
+        with self.profiler.time('vote_count'):
+            if self.events is None:
+                self.print_vote_count()
+            else:
+                self.emit('votecount', self.modname, **self.vote_count_state())
+
+    def emit(self, type, author=None, target=None, line=None, **data):
+        """Pass an event for the last post to the `events` function."""
+        event = {'type': type, 'post': self.last_post, 'author': author,
+                 'target': target, 'line': line}
+        event.update(data)
+        self.events(event)
+
+    def write_event(self, event):
+        """Write an event to `out` as one line of JSON."""
+        self.out.write(json.dumps(event) + '\n')
+
+    def iter_events(self, records):
+        """Apply PostRecords like apply_records, yielding every event as a
+        dict as soon as its post has been applied instead of printing
+        anything.
+
+        `records` can be any iterable, but it is read in full first, so
+        that all of its votes can be matched in one batch."""
+        records = list(records)
+        pending = []
+        events, self.events = self.events, pending.append
+        try:
+            self.prime_votes(records)
+            for record in records:
+                self.apply_post(record)
+                yield from pending
+                pending.clear()
+        finally:
+            self.events = events
+            if self.archive is not None:
+                self.archive.commit()
+
+    def archive_post(self, record, events):
+        if self.archive is not None:
+            self.archive.add_post(self.thread, record.postnum, record.user,
+                                  [plain for plain, _ in record.lines], events)
+
+    def rewind(self, postnum):
+        """Rebuild the vote state as it was right after post `postnum`,
+        from the votes, replacements and vote count in the archive."""
+        self.votes = None
+        self.valid_players = []
+        self.replacements = {}
+        self.resolver.set_players(())
+        self.last_votecount_post = None
+        for event in self.archive.events(self.thread, ('votecount', 'vote', 'unvote', 'replace'),
+                                         end=postnum):
+            if event.type == 'votecount':
+                if self.votes is not None:
+                    continue
+                if self.modname is None:
+                    self.modname = event.author
+                self.last_votecount_post = event.postnum
+                self.day = event.data['day']
+                self.count_no = event.data['count_no']
+                self.votes = VoteTable((voter, (p, votee)) for voter, p, votee in event.data['votes'])
+                self.valid_players = list(self.votes)
+                self.resolver.set_players(self.valid_players)
+            elif self.votes is None:
+                continue
+            elif event.type == 'replace':
+                self.replace_player(event.data['original'], event.target)
+            elif event.author not in self.votes:
+                continue
+            elif event.type == 'unvote':
+                self.votes[event.author] = event.postnum, None
+            elif event.target is not None:
+                self.votes[event.author] = event.postnum, event.target
+        self.last_post = postnum
+
+    def process_page(self, page, end_post=None):
+        start = time.perf_counter()
+        with self.profiler.time('parse'):
+            doc = lxml.html.fromstring(page)
+        end_post = self.process_doc(doc, end_post)
+        self.profiler.page(time.perf_counter() - start)
         return end_post
 
-    def run(self, start_post=0, end_post=None, page_size=200):
+    def process_doc(self, doc, end_post=None):
+        """Like process_page, for a page that has already been parsed."""
+        end_post, records = doc_records(doc, end_post, self.profiler)
+        self.apply_records(records)
+        return end_post
+
+    def apply_records(self, records):
+        """Apply a page's worth of PostRecords, in order.
+
+        Everything the page prints is collected and written out at once,
+        so a long page is one write instead of thousands of small ones."""
+        profiler = self.profiler
+        out = self.out
+        self.out = io.StringIO()
+        try:
+            with profiler.time('prime'):
+                self.prime_votes(records)
+            for record in records:
+                start = time.perf_counter()
+                self.apply_post(record)
+                profiler.post(time.perf_counter() - start)
+        finally:
+            out.write(self.out.getvalue())
+            self.out = out
+        if self.archive is not None:
+            with profiler.time('archive'):
+                self.archive.commit()
+
+    def prime_votes(self, records):
+        """Match all the votes players cast in some PostRecords at once,
+        before the posts are applied one by one.
+
+        If the roster changes partway through, the rest of the votes are
+        simply matched again as they are counted."""
+        if not self.votecount_enabled or not self.votes:
+            return
+        self.resolver.resolve_many(
+            vote
+            for record in records
+            if record.user in self.votes
+            and (self.last_post is None or record.postnum > self.last_post)
+            for vote in (line_vote(plain, raw_vote) for plain, raw_vote in record.lines)
+            if vote is not None)
+
+    def process_stream(self, chunks, end_post=None):
+        """Like process_page, but parses the page from chunks of its text as
+        they arrive, handling each post as soon as it is complete."""
+        page_start = time.perf_counter()
+        chunks = iter(chunks)
+        stream = PostStream(chunks)
+        for post in stream:
+            if end_post is None:
+                end_post = stream.end_post
+            if post.postnum > end_post:
+                break
+            start = time.perf_counter()
+            self.process_post(post)
+            self.profiler.post(time.perf_counter() - start)
+        # Read the rest of a page we stopped partway through, so it still
+        # gets cached and its response is closed
+        for _ in chunks:
+            pass
+        if self.archive is not None:
+            with self.profiler.time('archive'):
+                self.archive.commit()
+        self.profiler.page(time.perf_counter() - page_start)
+        return stream.end_post if end_post is None else end_post
+
+    def save_checkpoint(self, path=None):
+        """Write everything needed to pick the thread back up after the last
+        processed post."""
+        state = {
+            'thread': self.query,
+            'last_post': self.last_post,
+            'votes': None if self.votes is None else dict(self.votes),
+            'valid_players': self.valid_players,
+            'replacements': self.replacements,
+            'day': self.day,
+            'count_no': self.count_no,
+            'modname': self.modname,
+            'last_votecount_post': self.last_votecount_post,
+        }
+        path = path or self.checkpoint
+        with atomic_write(path) as f:
+            json.dump(state, f)
+
+    def load_checkpoint(self, path=None):
+        with open(path or self.checkpoint, encoding='utf-8') as f:
+            state = json.load(f)
+        if state['thread'] != self.query:
+            raise ValueError("Checkpoint is for a different thread: {}".format(state['thread']))
+        self.last_post = state['last_post']
+        if state['votes'] is None:
+            self.votes = None
+        else:
+            self.votes = VoteTable((voter, tuple(vote)) for voter, vote in state['votes'].items())
+        self.valid_players = state['valid_players']
+        self.resolver.set_players(self.valid_players)
+        self.replacements = state['replacements']
+        self.day = state['day']
+        self.count_no = state['count_no']
+        self.modname = state['modname']
+        self.last_votecount_post = state['last_votecount_post']
+
+    def resume_start(self, page_size=200):
+        """The start of the page holding the first post not yet processed."""
+        if self.last_post is None:
+            return 0
+        return (self.last_post + 1) // page_size * page_size
+
+    def fetch_page(self, start_post, page_size=200, stream=False):
+        """Download one page of the thread, serving it from the page cache
+        when the thread is known to have grown past it.
+
+        With `stream`, returns an iterator over chunks of the page's text as
+        they arrive instead of the whole text."""
+        cached = None
+        headers = {}
+        if self.cache is not None:
+            cached = self.cache.load(self.query, start_post, page_size)
+            if cached is not None:
+                if self.cache.is_complete(self.query, start_post, page_size):
+                    self.profiler.count('cache_hits')
+                    return iter([cached.text]) if stream else cached.text
+                if cached.etag:
+                    headers['If-None-Match'] = cached.etag
+                if cached.last_modified:
+                    headers['If-Modified-Since'] = cached.last_modified
+
         qargs = dict(self.query)
         qargs['ppp'] = page_size
-        while end_post is None or start_post < end_post:
-            if start_post:
-                qargs['start'] = start_post
-            res = requests.get(self.base_url, params=qargs)
-            if res.status_code == 200:
-                end_post = self.process_page(res.text, end_post)
-                start_post += page_size
-            else:
-                raise Exception("Request error!")
+        if start_post:
+            qargs['start'] = start_post
+        # Counted here rather than read off the fetcher, which may be
+        # shared with other games
+        self.profiler.count('http_requests')
+        try:
+            res = self.fetcher.get(self.base_url, params=qargs, headers=headers,
+                                   stream=stream)
+        except FetchError:
+            self.profiler.count('http_errors')
+            raise
+        if not stream:
+            self.profiler.count('http_bytes', len(res.content))
+        if res.status_code == 304 and cached is not None:
+            self.profiler.count('not_modified')
+            return iter([cached.text]) if stream else cached.text
+        if stream:
+            return self._iter_response(res, start_post, page_size)
+        if self.cache is not None:
+            self.cache.store(self.query, start_post, page_size, res.text,
+                             res.headers.get('ETag'), res.headers.get('Last-Modified'))
+        return res.text
+
+    def _iter_response(self, res, start_post, page_size):
+        chunks = []
+        for chunk in self.fetcher.iter_text(res):
+            if self.cache is not None:
+                chunks.append(chunk)
+            yield chunk
+        if self.cache is not None:
+            self.cache.store(self.query, start_post, page_size, ''.join(chunks),
+                             res.headers.get('ETag'), res.headers.get('Last-Modified'))
+
+    def run(self, start_post=0, end_post=None, page_size=200, workers=1,
+            stream=False):
+        """Fetch and process the thread, one page of `page_size` posts at a time.
+
+        Once the end of the thread is known (from the first page's pagination
+        or from `end_post`), up to `workers` pages are downloaded at the same
+        time. Pages are always processed in post order.
+
+        Without an `end_post`, every page reports its own post count, so a
+        stale page from the cache cannot cut the run short.
+
+        With `stream`, each page is parsed while it downloads (see
+        process_stream) instead of after."""
+        def fetch(start):
+            with self.profiler.time('fetch'):
+                return self.fetch_page(start, page_size, stream)
+
+        process = self.process_stream if stream else self.process_page
+        last_post = end_post
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while last_post is None or start_post < last_post:
+                if last_post is None:
+                    starts = [start_post]
+                else:
+                    starts = range(start_post, last_post, page_size)
+                for page in pool.map(fetch, starts):
+                    last_post = process(page, end_post)
+                    if end_post is None and self.cache is not None:
+                        self.cache.update_post_count(self.query, last_post)
+                    if self.checkpoint:
+                        self.save_checkpoint()
+                start_post = starts[-1] + page_size
+
+    def replay(self, path, start_post=0, end_post=None, workers=1, processes=False):
+        """Process a thread saved on disk instead of downloading it.
+
+        `path` is anything pagefiles.open_pages can read. With `workers`,
+        that many pages are read, decompressed and parsed into PostRecords
+        at the same time, a few pages ahead of the one being applied. With
+        `processes`, pages are parsed in worker processes instead of
+        threads (but read in this one), so parsing can use every core."""
+        from pagefiles import open_pages
+
+        if start_post > 0 and (self.last_post is None or self.last_post < start_post - 1):
+            self.last_post = start_post - 1 # Skip everything before start_post
+
+        def parse(load):
+            with self.profiler.time('read'):
+                page = load()
+            return extract_records(page, end_post, self.profiler)
+
+        if processes:
+            from concurrent.futures import ProcessPoolExecutor as executor
+        else:
+            executor = ThreadPoolExecutor
+        with executor(max_workers=workers) as pool:
+            pending = deque()
+            pages = open_pages(path)
+            while True:
+                for load in itertools.islice(pages, 2 * workers - len(pending)):
+                    if processes:
+                        pending.append(pool.submit(extract_records, load(), end_post))
+                    else:
+                        pending.append(pool.submit(parse, load))
+                if not pending:
+                    break
+                with self.profiler.time('wait'):
+                    _, records = pending.popleft().result()
+                start = time.perf_counter()
+                self.apply_records(records)
+                self.profiler.page(time.perf_counter() - start)
+                if self.checkpoint:
+                    self.save_checkpoint()
+                if (end_post is not None and self.last_post is not None
+                        and self.last_post >= end_post):
+                    break
+            for future in pending:
+                future.cancel()
+
+    def update_profile(self):
+        """Copy the vote cache's counters into the profiler, and return it."""
+        self.profiler.counters.update({
+            'vote_cache_hits': self.resolver.hits,
+            'vote_cache_misses': self.resolver.misses,
+        })
+        return self.profiler
+
+    def poll(self, page_size=200, workers=1, stream=False):
+        """Process the posts made since the last one seen.
+
+        Returns whether there were any."""
+        before = self.last_post
+        self.run(self.resume_start(page_size), page_size=page_size, workers=workers,
+                 stream=stream)
+        return self.last_post != before
+
+    def watch(self, start_post=0, page_size=200, workers=1, interval=30,
+              max_interval=600, stream=False):
+        """Process the thread, then keep polling its last page for new posts.
+
+        The polling interval doubles while the thread is quiet, up to
+        `max_interval` seconds, and drops back to `interval` as soon as
+        something is posted. Errors are reported and back the polling off
+        the same way, rather than ending the watch."""
+        self.run(start_post, page_size=page_size, workers=workers, stream=stream)
+        delay = interval
+        while True:
+            self.out.flush()
+            time.sleep(delay)
+            try:
+                active = self.poll(page_size, workers, stream)
+            except FetchError as e:
+                self.warning(e)
+                active = False
+            except Exception:
+                self.error("Polling failed: {}", traceback.format_exc())
+                active = False
+            delay = interval if active else min(delay * 2, max_interval)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
         description="Parses out mod-relevant info such as @mod and VOTEs")
 
     parser.add_argument('game_url',
-                        help="The url of the game to use. (or file)")
+                        help="The url of the game to use, or a page, directory "
+                             "or zip/tar archive of pages saved from it.")
     parser.add_argument('-s', '--start', type=int, default=0, dest='start_post',
                         help="The post # to start from")
     parser.add_argument('-e', '--end', type=int, dest='end_post',
@@ -337,11 +973,47 @@ if __name__ == '__main__':
                         help="Automatically confirm interactive confirmations.")
     parser.add_argument('-i', '--interactive-fixes', action='store_true',
                         help="Allow user to correct imperfect vote matches interactively.")
+    parser.add_argument('-j', '--jobs', type=int, default=1, dest='workers',
+                        help="The number of pages to download, or read from "
+                             "disk, at the same time.")
+    parser.add_argument('-P', '--processes', action='store_true',
+                        help="Parse saved pages in -j worker processes instead "
+                             "of threads.")
+    parser.add_argument('-r', '--retries', type=int, default=3,
+                        help="How many times to retry a failed page request.")
+    parser.add_argument('-c', '--cache', metavar='DIR',
+                        help="Keep downloaded pages in DIR and only re-request "
+                             "the ones that can still change.")
+    parser.add_argument('-k', '--checkpoint', metavar='FILE',
+                        help="Save the vote state to FILE after every page and "
+                             "resume from it on the next run.")
+    parser.add_argument('-a', '--archive', metavar='DB',
+                        help="Store every processed post and its votes, @mods, "
+                             "V/LAs and replacements in the SQLite database DB. "
+                             "Saved pages are archived under their file or "
+                             "directory name, not the thread's url.")
+    parser.add_argument('--stream', action='store_true',
+                        help="Parse each page while it downloads.")
+    parser.add_argument('-w', '--watch', action='store_true',
+                        help="Keep watching the thread for new posts.")
+    parser.add_argument('--interval', type=float, default=30,
+                        help="The shortest time between checks in watch mode, "
+                             "in seconds.")
+    parser.add_argument('--json', action='store_true',
+                        help="Print every event (@mods, V/LAs, votes, unvotes, "
+                             "hammers, replacements and vote counts) as one line "
+                             "of JSON instead of colored text.")
+    parser.add_argument('--profile', nargs='?', const='-', metavar='FILE',
+                        help="Time every stage and print a summary to stderr at "
+                             "exit, or write it to FILE as JSON.")
 
     args = parser.parse_args()
 
     rcfile = os.path.join(os.path.expanduser('~'), '.modtoolrc')
     if os.path.isfile(rcfile):
+        import configparser
+        import themes
+
         config = configparser.ConfigParser()
         config.read(rcfile)
         try:
@@ -354,12 +1026,49 @@ if __name__ == '__main__':
     if args.votecount and not args.modname:
         print(fmt.yellow("NOTE: votecount was requested, but modname was "
                          "unspecified. Moderator will be inferred from "
-                         "inital vote count post."))
+                         "inital vote count post."),
+              file=sys.stderr if args.json else sys.stdout)
+    fetcher = Fetcher(retries=args.retries, pool_size=max(args.workers, 10))
     mod_tool = ModTool(args.game_url, votecount=args.votecount,
                        modname=args.modname, deadline=args.deadline,
-                       theme=theme)
-    mod_tool.run(args.start_post, args.end_post)
-    if args.votecount:
+                       theme=theme, fetcher=fetcher,
+                       cache=PageCache(args.cache) if args.cache else None,
+                       checkpoint=args.checkpoint,
+                       archive=Archive(args.archive) if args.archive else None,
+                       profiler=Profiler() if args.profile else None,
+                       events='json' if args.json else None)
+    if args.checkpoint and os.path.isfile(args.checkpoint):
+        try:
+            mod_tool.load_checkpoint()
+        except ValueError as e:
+            mod_tool.error(str(e))
+            sys.exit(1)
+        args.start_post = max(args.start_post, mod_tool.resume_start())
+    try:
+        if os.path.exists(args.game_url):
+            if args.watch:
+                parser.error("--watch needs a game url")
+            mod_tool.replay(args.game_url, args.start_post, args.end_post,
+                            workers=args.workers, processes=args.processes)
+        elif args.watch:
+            mod_tool.watch(args.start_post, workers=args.workers,
+                           interval=args.interval, stream=args.stream)
+        else:
+            mod_tool.run(args.start_post, args.end_post, workers=args.workers,
+                         stream=args.stream)
+    except FetchError as e:
+        mod_tool.error(str(e))
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print(file=sys.stderr if args.json else sys.stdout)
+    if args.votecount and args.json:
+        if mod_tool.votes:
+            mod_tool.emit('votecount', mod_tool.modname, **mod_tool.vote_count_state())
+    elif args.votecount:
         print('=' * 50)
         print()
         mod_tool.print_vote_count(args.backlink)
+    if args.profile == '-':
+        mod_tool.update_profile().report(sys.stderr)
+    elif args.profile:
+        mod_tool.update_profile().dump(args.profile)
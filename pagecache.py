@@ -0,0 +1,76 @@
+import json
+import os
+import os.path
+from collections import namedtuple
+from urllib import parse as urlparse
+
+from atomicfile import atomic_write
+
+CachedPage = namedtuple('CachedPage', 'text etag last_modified')
+
+class PageCache:
+    """Raw page HTML stored on disk, keyed by thread, start post and page size.
+
+    The cache also remembers the largest post count seen for each thread.
+    Posts are never added to a page once the thread has grown past it, so
+    any page that ends before the last known post can be served without
+    asking the forum again. The page holding the last known post is always
+    revalidated, since it is where the current post count comes from."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._post_counts = {}
+
+    def _thread_dir(self, query):
+        name = '-'.join(urlparse.quote(k + query[k], safe='') for k in sorted(query))
+        return os.path.join(self.directory, name or 'thread')
+
+    def _page_path(self, query, start, ppp):
+        return os.path.join(self._thread_dir(query), '{}-{}'.format(ppp, start))
+
+    @staticmethod
+    def _write(path, data):
+        with atomic_write(path) as f:
+            f.write(data)
+
+    def post_count(self, query):
+        """The largest number of posts ever seen in the thread."""
+        key = self._thread_dir(query)
+        if key not in self._post_counts:
+            try:
+                with open(os.path.join(key, 'index.json'), encoding='utf-8') as f:
+                    self._post_counts[key] = json.load(f)['posts']
+            except (OSError, ValueError, KeyError):
+                self._post_counts[key] = 0
+        return self._post_counts[key]
+
+    def update_post_count(self, query, posts):
+        if posts <= self.post_count(query):
+            return
+        key = self._thread_dir(query)
+        os.makedirs(key, exist_ok=True)
+        self._write(os.path.join(key, 'index.json'), json.dumps({'posts': posts}))
+        self._post_counts[key] = posts
+
+    def is_complete(self, query, start, ppp):
+        return start + ppp < self.post_count(query)
+
+    def load(self, query, start, ppp):
+        path = self._page_path(query, start, ppp)
+        try:
+            with open(path + '.html', encoding='utf-8') as f:
+                text = f.read()
+            with open(path + '.json', encoding='utf-8') as f:
+                headers = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return CachedPage(text, headers.get('etag'), headers.get('last_modified'))
+
+    def store(self, query, start, ppp, text, etag=None, last_modified=None):
+        path = self._page_path(query, start, ppp)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._write(path + '.html', text)
+        self._write(path + '.json', json.dumps({
+            'etag': etag,
+            'last_modified': last_modified,
+        }))
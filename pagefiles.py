@@ -0,0 +1,88 @@
+"""Reads saved thread pages from disk for offline replays.
+
+A thread can be saved as a directory of HTML pages, a zip or tar archive
+of them (compressed or not), or a single, optionally gzipped, page. Pages
+are put in thread order by the numbers in their names, so page-200.html
+comes before page-1000.html."""
+
+import gzip
+import os
+import os.path
+import re
+import tarfile
+import zipfile
+
+PAGE_EXTENSIONS = ('.html', '.htm', '.html.gz', '.htm.gz')
+
+def _natural_key(name):
+    return [int(part) if part.isdigit() else part
+            for part in re.split(r'(\d+)', name)]
+
+def _is_page(name):
+    return name.lower().endswith(PAGE_EXTENSIONS)
+
+def _decode(data, name):
+    if name.lower().endswith('.gz'):
+        data = gzip.decompress(data)
+    return data.decode('utf-8')
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return _decode(f.read(), path)
+
+def open_pages(path):
+    """Yield a function for each page saved at `path`, in thread order.
+
+    Calling one reads and decompresses that page and returns its text.
+    Pages in a directory or zip file can be read from several threads at
+    once; tar members are read as the functions are yielded, since a tar
+    can only be read in order."""
+    if os.path.isdir(path):
+        names = sorted((n for n in os.listdir(path) if _is_page(n)), key=_natural_key)
+        for name in names:
+            yield lambda name=name: _read_file(os.path.join(path, name))
+    elif zipfile.is_zipfile(path):
+        # Left open for as long as any of the functions are around; members
+        # can be decompressed from several threads at once.
+        archive = zipfile.ZipFile(path)
+        names = sorted((n for n in archive.namelist() if _is_page(n)), key=_natural_key)
+        for name in names:
+            yield lambda name=name: _decode(archive.read(name), name)
+    elif tarfile.is_tarfile(path):
+        with tarfile.open(path) as archive:
+            members = sorted((m for m in archive.getmembers() if m.isfile() and _is_page(m.name)),
+                             key=lambda m: _natural_key(m.name))
+            for member in members:
+                data = archive.extractfile(member).read()
+                yield lambda data=data, name=member.name: _decode(data, name)
+    else:
+        yield lambda: _read_file(path)
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    import lxml.html
+
+    from posts import drop_quotes, extract_posts
+
+    parser = argparse.ArgumentParser(
+        description="Measures how fast saved pages can be read and parsed")
+    parser.add_argument('path',
+                        help="A directory, archive or file of saved pages.")
+    parser.add_argument('-j', '--jobs', type=int, default=1, dest='workers',
+                        help="The number of pages to read and parse at the same time.")
+    args = parser.parse_args()
+
+    def parse(load):
+        doc = lxml.html.fromstring(load())
+        drop_quotes(doc)
+        return sum(1 for _ in extract_posts(doc))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        counts = list(pool.map(parse, open_pages(args.path)))
+    elapsed = time.perf_counter() - start
+    print("{} pages, {} posts in {:.2f}s ({:.0f} posts/s)".format(
+        len(counts), sum(counts), elapsed, sum(counts) / elapsed if elapsed else 0))
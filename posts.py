@@ -0,0 +1,202 @@
+from collections import namedtuple
+
+import lxml.html
+from lxml import etree
+
+from profiling import NO_PROFILER
+
+Post = namedtuple('Post', 'postnum user content vote_counter')
+# A Post boiled down to plain data that can be sent between processes
+PostRecord = namedtuple('PostRecord', 'postnum user lines vote_count')
+
+def _class_xpath(class_name):
+    return etree.XPath(
+        'descendant-or-self::*[@class and contains('
+        'concat(" ", normalize-space(@class), " "), " {} ")]'.format(class_name))
+
+_QUOTES = etree.XPath('.//blockquote')
+_PAGINATION = _class_xpath('pagination')
+_POSTS = _class_xpath('post')
+_CONTENT = _class_xpath('content')
+_POSTNUM = etree.XPath('.//p[@class="author"]/a/strong')
+_AUTHOR = etree.XPath('.//dl[@class="postprofile"]/dt/a')
+_VOTE_COUNTER = etree.XPath('.//fieldset[legend[starts-with(text(),"Official Vote Count")]]')
+_LEGEND = etree.XPath('legend')
+
+def page_end_post(doc):
+    """The number of posts in the thread, according to the page's pagination."""
+    return int(_PAGINATION(doc)[0].text_content().lstrip('"').split()[0])
+
+def drop_quotes(doc):
+    for quote in _QUOTES(doc):
+        quote.drop_tree()
+
+def _make_post(post):
+    vote_counter = _VOTE_COUNTER(post)
+    return Post(
+        int(_POSTNUM(post)[0].text_content().strip().lstrip('#')),
+        _AUTHOR(post)[0].text_content().strip(),
+        _CONTENT(post)[0],
+        vote_counter[0] if vote_counter else None,
+    )
+
+def extract_posts(doc):
+    """Yield a Post for every post on a parsed page, in page order.
+
+    `vote_counter` is the post's official vote count fieldset, or None."""
+    for post in _POSTS(doc):
+        yield _make_post(post)
+
+class PostStream:
+    """Parses a page incrementally from chunks of its text.
+
+    Iterating yields a Post as soon as the post's closing tag has been
+    parsed, with its quotes already dropped. Each post is cleared from the
+    tree once the consumer asks for the next one, so memory use stays flat
+    however many posts the page holds. `end_post` is set as soon as the
+    page's pagination has been parsed."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.end_post = None
+
+    def __iter__(self):
+        parser = etree.HTMLPullParser(events=('end',))
+        parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+        for chunk in self.chunks:
+            parser.feed(chunk)
+            yield from self._read_events(parser)
+        parser.close()
+        yield from self._read_events(parser)
+
+    def _read_events(self, parser):
+        for _, el in parser.read_events():
+            classes = (el.get('class') or '').split()
+            if 'post' in classes:
+                drop_quotes(el)
+                yield _make_post(el)
+                el.clear(keep_tail=True)
+                parent = el.getparent()
+                while el.getprevious() is not None:
+                    del parent[0]
+            elif self.end_post is None and 'pagination' in classes:
+                self.end_post = page_end_post(el)
+
+def _is_vote(element):
+    return 'bbvote' in (element.get('class') or '').split()
+
+def iter_lines(element):
+    """Split an already-parsed element into its `<br />`-separated lines.
+
+    Yields `(text, vote)` for every line, where `text` is the stripped plain
+    text of the line and `vote` is the text of the first `bbvote` span that
+    starts on that line (or None). The element's tail is treated as part of
+    its last line. This walks the tree once instead of serializing it and
+    parsing every line again."""
+    parts = []
+    vote = None
+    voting = None # The bbvote element whose text is being collected
+    for event, el in etree.iterwalk(element, events=('start', 'end', 'comment', 'pi')):
+        if event == 'comment' or event == 'pi':
+            if el.tail:
+                parts.append(el.tail)
+                if voting is not None:
+                    vote.append(el.tail)
+            continue
+        if event == 'start':
+            if el.tag == 'br':
+                yield ''.join(parts).strip(), None if vote is None else ''.join(vote)
+                parts = []
+                vote = None
+                voting = None
+                continue
+            if vote is None and _is_vote(el):
+                vote = []
+                voting = el
+            if el.text:
+                parts.append(el.text)
+                if voting is not None:
+                    vote.append(el.text)
+        else:
+            if el is voting:
+                voting = None
+            if el.tail:
+                parts.append(el.tail)
+                if voting is not None:
+                    vote.append(el.tail)
+    yield ''.join(parts).strip(), None if vote is None else ''.join(vote)
+
+def read_vote_count(vote_counter):
+    """Split an official vote count fieldset into its legend's text and
+    the iter_lines of the rest. The legend is dropped from the tree."""
+    header = _LEGEND(vote_counter)[0]
+    legend = header.text_content()
+    header.drop_tree()
+    return legend, list(iter_lines(vote_counter))
+
+def post_record(post):
+    """A PostRecord for a Post.
+
+    `lines` is the iter_lines of the post's content, and `vote_count` is
+    the read_vote_count of its official vote count, or None."""
+    lines = list(iter_lines(post.content))
+    vote_count = None if post.vote_counter is None else read_vote_count(post.vote_counter)
+    return PostRecord(post.postnum, post.user, lines, vote_count)
+
+def doc_records(doc, end_post=None, profiler=NO_PROFILER):
+    """PostRecords for the posts on a parsed page, up to `end_post` (or the
+    end of the thread), as `(end_post, records)`."""
+    with profiler.time('quotes'):
+        drop_quotes(doc)
+    with profiler.time('extract'):
+        if end_post is None:
+            end_post = page_end_post(doc)
+        posts = []
+        for post in extract_posts(doc):
+            if post.postnum > end_post:
+                break
+            posts.append(post)
+    with profiler.time('lines'):
+        records = [post_record(post) for post in posts]
+    return end_post, records
+
+def extract_records(page, end_post=None, profiler=NO_PROFILER):
+    """doc_records for a page's text. Doesn't depend on any state, so it
+    can run in another process."""
+    with profiler.time('parse'):
+        doc = lxml.html.fromstring(page)
+    return doc_records(doc, end_post, profiler)
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    if len(sys.argv) <= 1:
+        sys.exit("usage: {} PAGE.html [REPEAT]".format(sys.argv[0]))
+
+    with open(sys.argv[1], encoding='utf-8') as f:
+        doc = lxml.html.fromstring(f.read())
+    drop_quotes(doc)
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    def extract_uncompiled(doc):
+        for post in doc.find_class('post'):
+            vote_counter = post.xpath(
+                './/fieldset[legend[starts-with(text(),"Official Vote Count")]]')
+            yield (
+                int(post.xpath('.//p[@class="author"]/a/strong')[0]
+                    .text_content().strip().lstrip('#')),
+                post.xpath('.//dl[@class="postprofile"]/dt/a')[0].text_content().strip(),
+                post.find_class('content')[0],
+                vote_counter[0] if vote_counter else None,
+            )
+
+    for name, extract in [('string xpath', extract_uncompiled),
+                          ('compiled xpath', extract_posts)]:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            count = sum(1 for _ in extract(doc))
+            best = min(best, time.perf_counter() - start)
+        print('{:>15}: {} posts, {:.1f} us/post'.format(
+            name, count, best / max(count, 1) * 1e6))
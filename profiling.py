@@ -0,0 +1,173 @@
+"""Opt-in timing of where a run spends its time.
+
+A Profiler adds up the time spent in each stage (fetching, parsing, quote
+stripping, line splitting, vote matching, ...), keeps latency histograms
+of whole pages and single posts, and remembers the slowest vote
+resolutions. Everything is a few clock reads and dict updates per page or
+post, so it is cheap enough to leave on. Code that can be profiled takes a
+profiler and defaults to NO_PROFILER, which does nothing."""
+
+import bisect
+import heapq
+import itertools
+import json
+import threading
+import time
+
+from atomicfile import atomic_write
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000,
+              10000, float('inf'))
+
+class _Timer:
+    __slots__ = 'profiler', 'stage', 'start'
+
+    def __init__(self, profiler, stage):
+        self.profiler = profiler
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.stage, time.perf_counter() - self.start)
+        return False
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def summary(self):
+        count = sum(self.counts)
+        return {
+            'count': count,
+            'mean_ms': self.total / count if count else 0.0,
+            'max_ms': self.max,
+            'buckets': {'<={:g}ms'.format(bound): n
+                        for bound, n in zip(BUCKETS_MS, self.counts) if n},
+        }
+
+class Profiler:
+    def __init__(self, slowest=10):
+        self.started = time.perf_counter()
+        self.stages = {} # name -> [calls, seconds]
+        self.counters = {}
+        self.pages = Histogram()
+        self.posts = Histogram()
+        self.slowest = slowest
+        self._votes = [] # min-heap of (seconds, n, vote)
+        self._order = itertools.count()
+        self._lock = threading.Lock() # Pages can be fetched from several threads
+
+    def time(self, stage):
+        """A context manager that adds the time spent in it to `stage`."""
+        return _Timer(self, stage)
+
+    def add(self, stage, seconds):
+        with self._lock:
+            totals = self.stages.get(stage)
+            if totals is None:
+                totals = self.stages[stage] = [0, 0.0]
+            totals[0] += 1
+            totals[1] += seconds
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def page(self, seconds):
+        self.pages.add(seconds)
+
+    def post(self, seconds):
+        self.posts.add(seconds)
+
+    def vote(self, vote, seconds):
+        """Record how long it took to match `vote` against the roster."""
+        self.add('match', seconds)
+        entry = seconds, next(self._order), vote
+        if len(self._votes) < self.slowest:
+            heapq.heappush(self._votes, entry)
+        elif entry > self._votes[0]:
+            heapq.heapreplace(self._votes, entry)
+
+    def summary(self):
+        return {
+            'wall_seconds': time.perf_counter() - self.started,
+            'stages': {name: {'calls': calls, 'seconds': seconds}
+                       for name, (calls, seconds) in self.stages.items()},
+            'counters': dict(self.counters),
+            'pages': self.pages.summary(),
+            'posts': self.posts.summary(),
+            'slowest_votes': [{'vote': vote, 'ms': seconds * 1000}
+                              for seconds, _, vote in sorted(self._votes, reverse=True)],
+        }
+
+    def dump(self, path):
+        with atomic_write(path) as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def report(self, file):
+        summary = self.summary()
+        print("Profile ({:.2f}s wall clock):".format(summary['wall_seconds']), file=file)
+        print("    {:<12} {:>8} {:>11} {:>9}".format('stage', 'calls', 'total ms', 'mean ms'),
+              file=file)
+        for name, stage in sorted(summary['stages'].items(), key=lambda s: -s[1]['seconds']):
+            print("    {:<12} {:>8} {:>11.1f} {:>9.3f}".format(
+                name, stage['calls'], stage['seconds'] * 1000,
+                stage['seconds'] * 1000 / stage['calls']), file=file)
+        for name in 'pages', 'posts':
+            histogram = summary[name]
+            print("{} ({}, mean {:.2f} ms, max {:.2f} ms):".format(
+                name.capitalize(), histogram['count'], histogram['mean_ms'],
+                histogram['max_ms']), file=file)
+            for bucket, n in histogram['buckets'].items():
+                print("    {:>10} {}".format(bucket, n), file=file)
+        if summary['slowest_votes']:
+            print("Slowest vote resolutions:", file=file)
+            for vote in summary['slowest_votes']:
+                print("    {:8.2f} ms  {!r}".format(vote['ms'], vote['vote']), file=file)
+        if summary['counters']:
+            print("Counters:", file=file)
+            for name, value in sorted(summary['counters'].items()):
+                print("    {:<20} {}".format(name, value), file=file)
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        return False
+
+class NullProfiler:
+    """A Profiler that records nothing."""
+    _timer = _NoTimer()
+
+    def time(self, stage):
+        return self._timer
+
+    def add(self, stage, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def page(self, seconds):
+        pass
+
+    def post(self, seconds):
+        pass
+
+    def vote(self, vote, seconds):
+        pass
+
+NO_PROFILER = NullProfiler()
@@ -1,24 +1,21 @@
 
+import heapq
+import os.path
 import re
-from fuzzywuzzy import fuzz
+from collections import Counter
 
-class LazySet(set):
-    __slots__ = '_gen',
-    def __init__(self, gen):
-        self._gen = gen
-        super().__init__()
+from fuzzywuzzy import fuzz, utils
 
-    def __contains__(self, item):
-        if not self and self._gen:
-            self.update(self._gen)
-            self._gen = None
-        return super().__contains__(item)
+from wordlist import WordList
 
-_WORDS = LazySet(w.strip() for w in open('words.txt'))
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_WORDS = WordList(os.path.join(_HERE, 'words.dat'), source=os.path.join(_HERE, 'words.txt'))
 
-def abbrev_score(abbr, full):
-    """Scores how well an abbreviation matches a username/string.
-    Assumes `abbr` is lowercased and only contains only alphanumerics."""
+def _abbrev_score_reference(abbr, full):
+    """abbrev_score, written as a plain recursion over slices.
+
+    Kept as the definition abbrev_score is checked against, and for the
+    names where lowercasing a slice isn't the same as slicing the lowercase."""
     l = len(abbr)
     if l > len(full) or l >= 5: # Not an acronym
         return 0
@@ -45,11 +42,77 @@ def abbrev_score(abbr, full):
                 or full[:cut].lower() in _WORDS
             ),
             0.85 # TODO: non-dictionary word model
-        ) * abbrev_score(abbr[1:], full[cut:]) * (
+        ) * _abbrev_score_reference(abbr[1:], full[cut:]) * (
             0.8 if cut == 1 and f[0] not in 'ai' else 1)
         if score > best:
             best = score
 
+def _word_starts(s):
+    # Positions where a new word starts, e.g. RadiantCowbells -> {0, 7}
+    return frozenset(
+        i for i, c in enumerate(s)
+        if i == 0 or c.isupper() or not s[i-1].isalpha())
+
+def _lowers_in_place(s, lower):
+    # Whether lower[i:j] == s[i:j].lower() for every slice. str.lower() only
+    # breaks this for characters that expand (İ) or depend on their
+    # neighbours (final Σ).
+    return len(lower) == len(s) and 'Σ' not in s
+
+def _abbrev_score(abbr, full, lower, starts):
+    """abbrev_score, given `full`'s lowercase form and _word_starts.
+
+    The recursion only ever looks at a suffix of `abbr` and a suffix of
+    `full`, so it is done on indices into them, and each pair of suffixes
+    is scored at most once."""
+    memo = {}
+
+    def score(k, p): # abbrev_score(abbr[k:], full[p:])
+        key = k, p
+        if key in memo:
+            return memo[key]
+        l = len(abbr) - k
+        if l > len(full) - p or l >= 5: # Not an acronym
+            result = 0
+        elif l <= 1: # Base case
+            result = float(lower.startswith(abbr[k:], p))
+        elif not lower.startswith(abbr[k], p):
+            result = 0
+        elif abbr[k+1:].isdigit(): # Match users with numbers, e.g. A50 ~ Almost50
+            result = float(full.endswith(abbr[k+1:]))
+        else:
+            result = 0
+            s = abbr[k+1].lower()
+            first_cut = 0.8 if lower[p] not in 'ai' else 1
+            cut = p
+            while True:
+                cut = lower.find(s, cut + 1)
+                if cut == -1:
+                    break
+                rest = score(k + 1, cut)
+                if not rest: # Skip the dictionary lookup
+                    continue
+                value = max(
+                    float(cut in starts or lower[p:cut] in _WORDS),
+                    0.85 # TODO: non-dictionary word model
+                ) * rest * (first_cut if cut == p + 1 else 1)
+                if value > result:
+                    result = value
+        memo[key] = result
+        return result
+
+    return score(0, 0)
+
+def abbrev_score(abbr, full):
+    """Scores how well an abbreviation matches a username/string.
+    Assumes `abbr` is lowercased and only contains only alphanumerics."""
+    if len(abbr) > len(full) or len(abbr) >= 5: # Not an acronym
+        return 0
+    lower = full.lower()
+    if not _lowers_in_place(full, lower):
+        return _abbrev_score_reference(abbr, full)
+    return _abbrev_score(abbr, full, lower, _word_starts(full))
+
 def user_ratio(a_orig, b_orig):
     a = ''.join([c.lower() for c in a_orig if c.isalnum()])
     b = ''.join([c.lower() for c in b_orig if c.isalnum()])
@@ -63,24 +126,204 @@ def user_ratio(a_orig, b_orig):
         fuzz.partial_ratio(a, b.split(None, 1)[0]) * 0.75,
     )
 
+def _normalize(s):
+    return ''.join([c.lower() for c in s if c.isalnum()])
+
+class _Name:
+    """Everything user_ratio derives from one side of a comparison."""
+    __slots__ = 'orig', 'lower', 'norm', 'chars', 'boundaries', 'in_place'
+
+    def __init__(self, orig):
+        self.orig = orig
+        self.lower = orig.lower()
+        self.norm = _normalize(orig)
+        self.chars = Counter(self.norm)
+        self.boundaries = _word_starts(orig)
+        self.in_place = _lowers_in_place(orig, self.lower)
+
+    def abbrev_score(self, abbr):
+        """abbrev_score(abbr, self.orig)"""
+        if len(abbr) > len(self.orig) or len(abbr) >= 5:
+            return 0
+        if not self.in_place:
+            return _abbrev_score_reference(abbr, self.orig)
+        return _abbrev_score(abbr, self.orig, self.lower, self.boundaries)
+
+    def may_abbreviate(self, other):
+        """Whether abbrev_score(self.norm, other.orig) can be nonzero."""
+        l = len(self.norm)
+        return (0 < l < 5 and l <= len(other.orig)
+                and other.lower.startswith(self.norm[0]))
+
+def _ratio_bound(matches, length):
+    # The most SequenceMatcher.ratio() can be with `matches` characters in common
+    return 2.0 * matches / length
+
+class PlayerIndex:
+    """Scores votes against a fixed list of players.
+
+    Scores are the same as user_ratio(vote, player), but everything that
+    depends only on a player is computed once, and players that cannot
+    reach the cutoff are skipped before running any fuzz scorer.
+
+    user_ratio also compares the first word of each side, but its
+    normalized forms have no spaces left, so those comparisons repeat
+    partial_ratio(a, b) at a lower weight and never change the result."""
+
+    def __init__(self, players):
+        self.players = list(players)
+        self._names = [_Name(p) for p in self.players]
+
+    def __len__(self):
+        return len(self.players)
+
+    def add(self, player):
+        self.players.append(player)
+        self._names.append(_Name(player))
+
+    def _score(self, vote, i, score_cutoff, fuzz_scores):
+        """user_ratio(vote.orig, player.orig) for the `i`th player, or None
+        if it is certainly below `score_cutoff`.
+
+        `fuzz_scores` holds the fuzz part of the score by player, for votes
+        with the same normalized form as this one."""
+        player = self._names[i]
+        a, b = vote.norm, player.norm
+        if a == b:
+            return 100
+        if not a or not b: # Let user_ratio deal with these
+            return user_ratio(vote.orig, player.orig)
+
+        if vote.may_abbreviate(player) or player.may_abbreviate(vote):
+            abbrev = max(player.abbrev_score(a), vote.abbrev_score(b)) * 95
+        else:
+            abbrev = 0
+
+        fuzz_score = fuzz_scores.get(i)
+        if fuzz_score is None:
+            common = sum((vote.chars & player.chars).values())
+            ratio_bound = utils.intr(100 * _ratio_bound(common, len(a) + len(b)))
+            partial_bound = _ratio_bound(common, min(len(a), len(b)) + common)
+            partial_bound = 100 if partial_bound > .995 else utils.intr(100 * partial_bound)
+            if max(abbrev, ratio_bound, partial_bound * 0.85) < score_cutoff:
+                return None
+            fuzz_score = fuzz_scores[i] = max(
+                fuzz.ratio(a, b),
+                fuzz.partial_ratio(a, b) * 0.85,
+            )
+
+        return max(abbrev, fuzz_score)
+
+    def _extract(self, name, score_cutoff, limit, fuzz_scores):
+        scored = []
+        for i in range(len(self._names)):
+            score = self._score(name, i, score_cutoff, fuzz_scores)
+            if score is not None and score >= score_cutoff:
+                scored.append((self.players[i], score))
+        return heapq.nlargest(limit, scored, key=lambda x: x[1])
+
+    def extract(self, vote, score_cutoff=0, limit=5, rows=None):
+        """The best-scoring players for a vote, as `(player, score)` pairs.
+
+        Same as fuzzywuzzy's process.extractBests(vote, players,
+        scorer=user_ratio) without any processing of the strings.
+
+        `rows` is a dict to share fuzz scores in between calls for a batch
+        of votes: votes that only differ in case or punctuation (e.g.
+        "Cool Guy", "coolguy" and "cool_guy") then only repeat the cheap
+        abbreviation check.
+
+        A vote without a single letter or digit (e.g. "!!") matches no one."""
+        name = _Name(vote)
+        if not name.norm:
+            return []
+        fuzz_scores = {} if rows is None else rows.setdefault(name.norm, {})
+        return self._extract(name, score_cutoff, limit, fuzz_scores)
+
+def _check(cases, seed=0):
+    """Compare abbrev_score with _abbrev_score_reference on the examples
+    and on `cases` random abbreviation/name pairs. Returns the mismatches."""
+    import random
+    rand = random.Random(seed)
+    pieces = ['papa', 'zito', 'not', 'mafia', 'cow', 'bells', 'radiant', 'beef',
+              'ster', 'almost', 'goron', 'north', 'side', 'gal', 'aa', 'ai', 'bab']
+    separators = ['', '', '', '_', ' ', '-', '.']
+    oddities = ['ß', 'İ', 'Σ', 'é', 'Ǆ']
+
+    def random_name():
+        words = []
+        for _ in range(rand.randint(1, 4)):
+            if rand.random() < 0.6:
+                word = rand.choice(pieces)
+            else:
+                word = ''.join(rand.choice('abcinos') for _ in range(rand.randint(1, 6)))
+            if rand.random() < 0.5:
+                word = word.capitalize()
+            words.append(word + rand.choice(separators))
+        if rand.random() < 0.3:
+            words.append(str(rand.randint(0, 999)))
+        if rand.random() < 0.05:
+            words.insert(rand.randrange(len(words) + 1), rand.choice(oddities))
+        return ''.join(words)
+
+    def random_abbr(name):
+        norm = _normalize(name)
+        if norm and rand.random() < 0.7: # A subsequence, so it usually matches
+            picks = sorted(rand.sample(range(len(norm)), min(len(norm), rand.randint(0, 5))))
+            return ''.join(norm[i] for i in picks)
+        return _normalize(random_name())[:rand.randint(0, 5)]
+
+    pairs = []
+    for a, b in _EXAMPLES:
+        pairs += [(_normalize(a), b), (_normalize(b), a)]
+    for _ in range(cases):
+        name = random_name()
+        pairs.append((random_abbr(name), name))
+
+    def outcome(score, abbr, name):
+        try:
+            return score(abbr, name)
+        except Exception as e:
+            return type(e).__name__
+
+    mismatches = []
+    for abbr, name in pairs:
+        fast = outcome(abbrev_score, abbr, name)
+        slow = outcome(_abbrev_score_reference, abbr, name)
+        if fast != slow:
+            mismatches.append((abbr, name, fast, slow))
+    return mismatches
+
+_EXAMPLES = [
+    ('N_M', 'Not_Mafia'),
+    ('NM', 'Not_Mafia'),
+    ('nsg', 'northsidegal'),
+    ('pz', 'Papa Zito'),
+    ('A50', 'Almost50'),
+    ('g27', 'Goron27'),
+    ('RC', 'RadiantCowbells'),
+    ('cedric', 'Cedrick'),
+    ('fitz', 'havingfitz'),
+    ('Zito', 'Papa Zito'),
+    ('RadiantScumbells', 'RadiantCowbells'),
+    ('beef', 'Beefster'),
+    ('beefy', 'Beefster'),
+    ('Beefeater', 'Beefster')
+]
+
 if __name__ == '__main__':
+    import sys
+
+    if sys.argv[1:2] == ['check']:
+        cases = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+        mismatches = _check(cases)
+        for mismatch in mismatches[:20]:
+            print(*mismatch)
+        print("{} mismatches in {} random cases".format(len(mismatches), cases))
+        sys.exit(bool(mismatches))
+
     import readline
-    for abbr, name in [
-        ('N_M', 'Not_Mafia'),
-        ('NM', 'Not_Mafia'),
-        ('nsg', 'northsidegal'),
-        ('pz', 'Papa Zito'),
-        ('A50', 'Almost50'),
-        ('g27', 'Goron27'),
-        ('RC', 'RadiantCowbells'),
-        ('cedric', 'Cedrick'),
-        ('fitz', 'havingfitz'),
-        ('Zito', 'Papa Zito'),
-        ('RadiantScumbells', 'RadiantCowbells'),
-        ('beef', 'Beefster'),
-        ('beefy', 'Beefster'),
-        ('Beefeater', 'Beefster')
-    ]:
+    for abbr, name in _EXAMPLES:
         print(abbr, name, user_ratio(abbr, name))
     # try:
     #     while True:
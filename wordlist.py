@@ -0,0 +1,121 @@
+"""A compact, memory-mapped dictionary for word membership tests.
+
+The packed format is a small header, a table of word end offsets and the
+words themselves concatenated in sorted order, so lookups are a binary
+search straight over the mapped file and nothing is loaded up front.
+
+Build it from a plain word list (one word per line) with:
+
+    python wordlist.py [words.txt [words.dat]]
+"""
+
+import mmap
+import os
+import os.path
+import struct
+
+from atomicfile import atomic_write
+
+MAGIC = b'WRD1'
+_HEADER = struct.Struct('<4sI')
+_OFFSET = struct.Struct('<I')
+
+def pack(words):
+    """Pack an iterable of words into the format WordList reads."""
+    words = sorted({w.encode('utf-8') for w in words})
+    offsets = []
+    end = 0
+    for w in words:
+        end += len(w)
+        offsets.append(end)
+    return b''.join([
+        _HEADER.pack(MAGIC, len(words)),
+        struct.pack('<{}I'.format(len(offsets)), *offsets),
+        *words,
+    ])
+
+def build(src, dst):
+    with open(src, encoding='utf-8') as f:
+        data = pack(w.strip() for w in f)
+    # Processes building at the same time can't map a half-written file
+    with atomic_write(dst, 'wb') as f:
+        f.write(data)
+
+class WordList:
+    """Membership tests against a packed word list.
+
+    The packed file is mapped on the first lookup. If it doesn't exist yet,
+    or `source` has changed since it was built, it is built from `source`;
+    if it can't be written, the packed words are kept in memory instead."""
+
+    def __init__(self, path, source=None):
+        self.path = path
+        self.source = source
+        self._data = None
+        self._count = 0
+        self._words_start = 0
+
+    def _is_stale(self):
+        try:
+            built = os.path.getmtime(self.path)
+        except OSError:
+            return True
+        try:
+            return os.path.getmtime(self.source) > built
+        except OSError: # No source to rebuild from; use what's there
+            return False
+
+    def _open(self):
+        if self.source and self._is_stale():
+            try:
+                build(self.source, self.path)
+            except OSError:
+                with open(self.source, encoding='utf-8') as f:
+                    self._load(pack(w.strip() for w in f))
+                return
+        with open(self.path, 'rb') as f:
+            self._load(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def _load(self, data):
+        magic, count = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("{} is not a packed word list".format(self.path))
+        self._count = count
+        self._words_start = _HEADER.size + count * _OFFSET.size
+        self._data = data
+
+    def _word(self, i):
+        data = self._data
+        end = _OFFSET.unpack_from(data, _HEADER.size + i * _OFFSET.size)[0]
+        start = _OFFSET.unpack_from(data, _HEADER.size + (i - 1) * _OFFSET.size)[0] if i else 0
+        return data[self._words_start + start:self._words_start + end]
+
+    def __contains__(self, word):
+        if self._data is None:
+            self._open()
+        key = word.encode('utf-8')
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            w = self._word(mid)
+            if w < key:
+                lo = mid + 1
+            elif w > key:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def __len__(self):
+        if self._data is None:
+            self._open()
+        return self._count
+
+if __name__ == '__main__':
+    import sys
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    src = sys.argv[1] if len(sys.argv) > 1 else os.path.join(here, 'words.txt')
+    dst = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(src)[0] + '.dat'
+    build(src, dst)
+    print("Packed {} words into {}".format(len(WordList(dst)), dst))